@@ -1,47 +1,245 @@
-from flask import Flask, render_template, request, redirect, url_for, session
-from tournament import draw_group, schedule_round_robin
+from flask import (
+    Flask, g, jsonify, render_template, request, redirect, url_for, session,
+    before_render_template, has_app_context, template_rendered,
+)
+from flask.json.provider import DefaultJSONProvider
+from markupsafe import Markup
+from tournament import (
+    BoardMatch,
+    RoundRobinSchedule,
+    StandingsTable,
+    board_lower_bound,
+    bracket_matches,
+    build_bracket,
+    draw_groups,
+    knockout_seeds,
+    match_winner,
+    players_known,
+    schedule_boards,
+    stage_rank,
+    stage_title,
+    record_result,
+    slot_known,
+    slot_labels,
+)
+import copy
+import itertools
 import json
+import queue
+import secrets
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime, timedelta
+import click
 import flask_login
 
+import db
+import metrics
+import ratings
+import serialization
+import sessions
+import simulate
+from broker import Broker, format_event
+from cache import StateCache
+from db import get_db, init_db
+
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "password"
 
+# highest score accepted for one side of a match
+MAX_SCORE = 999
 
-DB_PATH = "tournaments.db"
 
+init_db()
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
 
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, using orjson for compact output when installed."""
 
-def init_db():
-    conn = get_db()
-    conn.execute(
-        """CREATE TABLE IF NOT EXISTS tournaments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        created_at TEXT,
-        data TEXT
-    )"""
-    )
-    conn.commit()
-    conn.close()
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        if kwargs.keys() <= {'separators'}:
+            text = serialization.json_dumps(obj)
+        else:
+            text = super().dumps(obj, **kwargs)
+        _observe_json('dumps', time.perf_counter() - started)
+        return text
 
+    def loads(self, s, **kwargs):
+        started = time.perf_counter()
+        obj = serialization.json_loads(s)
+        _observe_json('loads', time.perf_counter() - started)
+        return obj
 
-init_db()
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
-app.secret_key = 'replace-this-secret'
-app.permanent_session_lifetime = timedelta(days=365)
+app.json = JSONProvider(app)
+# settings from the file named by TOURNAMENT_SETTINGS, then FLASK_* variables
+# (FLASK_SECRET_KEY, FLASK_SESSION_BACKEND, ...)
+# how long the admin stays logged in without a request; Flask's own default
+# is replaced before the settings are read, so they can override it
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=365)
+app.config.from_envvar('TOURNAMENT_SETTINGS', silent=True)
+app.config.from_prefixed_env()
+app.config.setdefault('STATE_CACHE_SIZE', 256)
+app.config.setdefault('STATE_CACHE_TTL', 300)
+app.config.setdefault('EVENT_QUEUE_SIZE', 32)
+app.config.setdefault('EVENT_HEARTBEAT', 15)
+# set when several worker processes serve the same database: cached pages
+# then check the revision, and writes made by other workers reach this
+# one's live streams by polling every EVENT_POLL_INTERVAL seconds
+app.config.setdefault('MULTI_WORKER', False)
+app.config.setdefault('EVENT_POLL_INTERVAL', 1.0)
+app.config.setdefault('WRITE_RETRIES', 5)
+app.config.setdefault('HTML_CACHE_SIZE', 256)
+app.config.setdefault('HTML_CACHE_TTL', 60)
+app.config.setdefault('ARCHIVE_FORMAT', serialization.best_format())
+app.config.setdefault('SNAPSHOT_FORMAT', app.config['ARCHIVE_FORMAT'])
+# logged results between two snapshots of a tournament's state
+app.config.setdefault('SNAPSHOT_EVERY', 50)
+# simulated tournaments per odds estimate; the pure-Python fallback is slow
+app.config.setdefault('SIMULATION_RUNS', 100_000 if simulate.np is not None else 2_000)
+# defaults of the board plan: boards in use, slots a player sits out after
+# a match and the length of a slot in minutes
+app.config.setdefault('BOARDS', 4)
+app.config.setdefault('BOARD_REST', 0)
+app.config.setdefault('MATCH_MINUTES', 20)
+# results shown for a search of the archive
+app.config.setdefault('SEARCH_LIMIT', 50)
+# rating points at stake in one match
+app.config.setdefault('ELO_K', ratings.K_FACTOR)
+# requests slower than this (seconds) are logged; None disables the log
+app.config.setdefault('SLOW_REQUEST_SECONDS', None)
+
+db.init_app(app)
+sessions.init_app(app)
+
+
+def _shared_secret():
+    # generated once and kept in the database, so every worker signs alike
+    conn = db.connect()
+    try:
+        key = db.shared_setting(conn, 'secret_key', lambda: secrets.token_hex(32))
+        conn.commit()
+        return key
+    finally:
+        conn.close()
+
+
+if not app.secret_key:
+    app.secret_key = _shared_secret()
+
+state_cache = StateCache(app.config['STATE_CACHE_SIZE'], app.config['STATE_CACHE_TTL'])
+html_cache = StateCache(app.config['HTML_CACHE_SIZE'], app.config['HTML_CACHE_TTL'])
+odds_cache = StateCache(app.config['STATE_CACHE_SIZE'], app.config['STATE_CACHE_TTL'])
+plan_cache = StateCache(app.config['STATE_CACHE_SIZE'], app.config['STATE_CACHE_TTL'])
+broker = Broker()
+
+registry = metrics.Registry()
+request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'Time to handle a request, up to the first byte of streams.',
+    ('method', 'route', 'status'),
+)
+render_seconds = registry.histogram(
+    'template_render_duration_seconds', 'Time to render a template, including nested ones.',
+    ('template',),
+)
+query_seconds = registry.histogram(
+    'sqlite_query_duration_seconds', 'Time to execute one SQLite statement.',
+)
+request_queries = registry.histogram(
+    'sqlite_queries_per_request', 'SQLite statements executed per request.',
+    ('route',), buckets=(1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+json_seconds = registry.histogram(
+    'json_duration_seconds', 'Time to encode or decode JSON request and response bodies.',
+    ('op',),
+)
+
+app.add_template_global(stage_title)
+app.add_template_global(players_known)
 
 login_manager = flask_login.LoginManager()
 login_manager.init_app(app)
 
 
+def _route_label():
+    # the rule, not the path, so tournament ids do not make new series
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _add_timing(key, seconds):
+    if has_app_context():
+        g.setdefault('timings', {})
+        g.timings[key] = g.timings.get(key, 0) + seconds
+
+
+def _observe_json(op, seconds):
+    json_seconds.observe(seconds, op)
+    _add_timing('json', seconds)
+
+
+def _observe_query(sql, seconds):
+    query_seconds.observe(seconds)
+    _add_timing('sql', seconds)
+    _add_timing('queries', 1)
+
+
+db.query_hooks.append(_observe_query)
+
+
+@before_render_template.connect_via(app)
+def _render_started(sender, template, context, **extra):
+    g.setdefault('renders', []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _render_finished(sender, template, context, **extra):
+    elapsed = time.perf_counter() - g.renders.pop()
+    render_seconds.observe(elapsed, template.name or '')
+    if not g.renders:
+        # nested renders are already part of the outer one
+        _add_timing('render', elapsed)
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = _route_label()
+    timings = g.get('timings', {})
+    request_seconds.observe(elapsed, request.method, route, str(response.status_code))
+    request_queries.observe(timings.get('queries', 0), route)
+    threshold = app.config['SLOW_REQUEST_SECONDS']
+    if threshold is not None and elapsed >= threshold:
+        app.logger.warning(
+            'slow request %s %s (%s) tournament=%s status=%d %.1fms: '
+            '%d queries %.1fms, render %.1fms, json %.1fms',
+            request.method, request.path, route,
+            (request.view_args or {}).get('t_id'), response.status_code, elapsed * 1000,
+            timings.get('queries', 0), timings.get('sql', 0) * 1000,
+            timings.get('render', 0) * 1000, timings.get('json', 0) * 1000,
+        )
+    return response
+
+
+@app.before_request
+def _drop_remember_cookie():
+    # logins used to set a remember cookie; have flask_login ignore and
+    # delete any still around instead of logging their holder back in
+    if app.config.get('REMEMBER_COOKIE_NAME', flask_login.COOKIE_NAME) in request.cookies:
+        session['_remember'] = 'clear'
+
+
 class User(flask_login.UserMixin):
     pass
 
@@ -55,14 +253,52 @@ def load_user(user_id):
     return None
 
 
+def _rank_groups(data):
+    """Give every group of freshly loaded state its table and ranking.
+
+    The ``table`` stays with the cached state, so a write copies it and
+    applies only its own results instead of replaying the group."""
+    for group in data['groups']:
+        group['table'] = StandingsTable.from_matches(
+            group['players'], group['schedule'], group['standings']
+        )
+        group['ranked'] = group['table'].ranked()
+
+
+def _load_state_at(t_id):
+    """Return ``(revision, (name, data))`` for a tournament, or ``None``.
+
+    Decoded state is shared through ``state_cache``; only the revision is read
+    from the database when the cached copy is current. Callers must not
+    mutate the returned data."""
+    conn = get_db()
+    revision = db.get_revision(conn, t_id)
+    if revision is None:
+        return None
+    loaded = state_cache.get(t_id, revision)
+    if loaded is None:
+        found = db.load_current(conn, t_id)
+        if found is None:
+            return None
+        revision, loaded = found
+        _rank_groups(loaded[1])
+        state_cache.put(t_id, revision, loaded)
+    return revision, loaded
+
+
+def _load_state(t_id):
+    """Return ``(name, data)`` for a tournament, or ``None``."""
+    found = _load_state_at(t_id)
+    return found[1] if found else None
+
+
 @app.context_processor
 def inject_tournament_name():
     name = None
-    tid = session.get('current_tournament_id')
+    tid = (request.view_args or {}).get('t_id') or session.get('current_tournament_id')
     if tid:
         conn = get_db()
         row = conn.execute('SELECT name FROM tournaments WHERE id=?', (tid,)).fetchone()
-        conn.close()
         if row:
             name = row['name']
     else:
@@ -84,11 +320,10 @@ def login():
     if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
         user = User()
         user.id = ADMIN_USERNAME
-        flask_login.login_user(
-            user,
-            remember=True,
-            duration=app.permanent_session_lifetime,
-        )
+        # the login lives in the stored session, which expires and is swept
+        # like any other; no remember cookie that would outlast it
+        flask_login.login_user(user)
+        session.permanent = True
     return redirect(url_for('index'))
 
 
@@ -100,38 +335,56 @@ def logout():
 @app.route('/')
 def index():
     players = []
-    page = request.args.get('page', 1, type=int)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
     per_page = 3
+    query = request.args.get('q', '').strip()
     conn = get_db()
-    total = conn.execute('SELECT COUNT(*) FROM tournaments').fetchone()[0]
-    rows = conn.execute(
-        "SELECT id, name, created_at, data FROM tournaments ORDER BY id DESC LIMIT ? OFFSET ?",
-        (per_page, (page - 1) * per_page),
-    ).fetchall()
-    conn.close()
-    tournaments = []
-    for r in rows:
-        data = json.loads(r["data"])
-        tournaments.append(
-            {
-                "id": r["id"],
-                "name": r["name"],
-                "created_at": r["created_at"],
-                "players": data.get("players", []),
-            }
-        )
-    has_next = page * per_page < total
-    has_prev = page > 1
+    if query:
+        rows = db.search_tournaments(conn, query, app.config['SEARCH_LIMIT'])
+        has_prev = has_next = False
+    else:
+        rows, has_prev, has_next = db.list_tournaments(conn, per_page, before, after)
+    tournaments = [
+        {
+            "id": r["id"],
+            "name": r["name"],
+            "created_at": r["created_at"],
+            "player_count": r["player_count"],
+            "status": r["status"],
+            "champion": r["champion"],
+        }
+        for r in rows
+    ]
     return render_template(
         'index.html',
         players=players,
         tournaments=tournaments,
-        page=page,
         has_next=has_next,
         has_prev=has_prev,
+        query=query,
     )
 
 
+@app.route('/api/search')
+def api_search():
+    """Tournaments matching ``q`` by name, player, champion or date, best first."""
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', app.config['SEARCH_LIMIT'], type=int), 1), 200)
+    rows = db.search_tournaments(get_db(), query, limit) if query else []
+    return jsonify(query=query, results=[
+        {
+            'id': r['id'],
+            'name': r['name'],
+            'created_at': r['created_at'],
+            'players': serialization.json_loads(r['player_names'] or '[]'),
+            'status': r['status'],
+            'champion': r['champion'],
+        }
+        for r in rows
+    ])
+
+
 @app.route('/add', methods=['POST'])
 def add_player():
     if not flask_login.current_user.is_authenticated:
@@ -139,11 +392,25 @@ def add_player():
     name = request.form.get('player_name', '').strip()
     if name:
         players = session.get('players', [])
-        players.append(name)
-        session['players'] = players
+        session['players'] = _unique_players(players + [name])
     return redirect(url_for('index'))
 
 
+def _unique_players(names):
+    """``names`` without blanks and repeats, first spelling kept.
+
+    Names are told apart the way the player index does it, so two entries
+    can never be the same indexed player."""
+    seen, players = set(), []
+    for name in names:
+        name = str(name).strip()
+        key = ratings.normalize_name(name)
+        if key and key not in seen:
+            seen.add(key)
+            players.append(name)
+    return players
+
+
 @app.route('/remove/<int:index>', methods=['POST'])
 def remove_player(index: int):
     if not flask_login.current_user.is_authenticated:
@@ -173,204 +440,53 @@ def start_tournament():
         return redirect(url_for('index'))
     players_json = request.form.get('players_json', '[]')
     try:
-        players = json.loads(players_json)
-    except json.JSONDecodeError:
+        players = _unique_players(json.loads(players_json))
+    except (json.JSONDecodeError, TypeError):
         players = []
     if not players:
         return redirect(url_for('index'))
-    group_a = draw_group(players.copy())
-    schedule_a = [{
-        'p1': m.p1,
-        'p2': m.p2,
-        'score1': None,
-        'score2': None,
-        'round': m.round,
-    } for m in schedule_round_robin(group_a)]
-    standings_a = [{'name': p, 'points': 0, 'gd': 0} for p in group_a]
+    # every group needs at least two players
+    groups = max(1, min(request.form.get('groups', 1, type=int) or 1, len(players) // 2))
+    advance = request.form.get('advance', type=int) if groups > 1 else None
+    drawn = draw_groups(players, groups, seeded=bool(request.form.get('seeded')))
+    if advance is not None:
+        # someone from every group goes through, at most the whole smallest group
+        advance = max(1, min(advance, min(len(members) for members in drawn.values())))
 
     tournament_data = {
         'players': players,
-        'group_a': group_a,
-        'schedule_a': schedule_a,
-        'standings_a': standings_a,
+        'groups': [
+            {'name': g, 'players': members, 'schedule': RoundRobinSchedule(members)}
+            for g, members in drawn.items()
+        ],
+        'advance': advance,
     }
 
     conn = get_db()
     name = request.form.get('title', '').strip()
     if not name:
         name = f"Tournament {datetime.utcnow().isoformat(timespec='seconds')}"
-    cur = conn.execute(
-        "INSERT INTO tournaments (name, created_at, data) VALUES (?, ?, ?)",
-        (name, datetime.utcnow().isoformat(timespec='seconds'), json.dumps(tournament_data)),
+    tid = db.create_tournament(
+        conn, name, datetime.utcnow().isoformat(timespec='seconds'), tournament_data
     )
-    tid = cur.lastrowid
     conn.commit()
-    conn.close()
 
     session['current_tournament_id'] = tid
     return render_template('loading.html', t_id=tid)
 
 
-def _find_standing(standings, name):
-    for s in standings:
-        if s['name'] == name:
-            return s
-    raise ValueError('player not found')
-
-
-def _apply_result(match, standings):
-    s1 = match['score1']
-    s2 = match['score2']
-    p1 = match['p1']
-    p2 = match['p2']
-    if s1 is None or s2 is None:
-        return
-    if s1 > s2:
-        _find_standing(standings, p1)['points'] += 3
-    elif s2 > s1:
-        _find_standing(standings, p2)['points'] += 3
-    else:
-        _find_standing(standings, p1)['points'] += 1
-        _find_standing(standings, p2)['points'] += 1
-    _find_standing(standings, p1)['gd'] += s1 - s2
-    _find_standing(standings, p2)['gd'] += s2 - s1
-
-def _revert_result(match, standings):
-    s1 = match['score1']
-    s2 = match['score2']
-    p1 = match['p1']
-    p2 = match['p2']
-    if s1 is None or s2 is None:
-        return
-    if s1 > s2:
-        _find_standing(standings, p1)['points'] -= 3
-    elif s2 > s1:
-        _find_standing(standings, p2)['points'] -= 3
-    else:
-        _find_standing(standings, p1)['points'] -= 1
-        _find_standing(standings, p2)['points'] -= 1
-    _find_standing(standings, p1)['gd'] -= s1 - s2
-    _find_standing(standings, p2)['gd'] -= s2 - s1
-
-
-def _compute_knockout_bracket(sorted_standings):
-    """Create a knockout bracket for 4-12 players based on standings."""
-    seeds = [s['name'] for s in sorted_standings]
-    n = len(seeds)
-    if n < 4:
-        return None
-
-    bracket = {'size': n, 'seeds': seeds}
-
-    # reduce players based on advancing rules
-    if n == 5:
-        seeds = seeds[:4]
-    elif n == 6:
-        seeds = seeds[:5]
-    elif n == 8:
-        seeds = seeds[:7]
-    elif n == 9:
-        seeds = seeds[:8]
-    elif n == 10:
-        seeds = seeds[:8]
-    elif n == 11:
-        seeds = seeds[:10]
-    elif n >= 12:
-        seeds = seeds[:12]
-
-    m = len(seeds)
-
-    playins = []
-    qfs = []
-    sfs = []
-
-    if m <= 4:
-        # direct semifinals
-        sfs = [
-            {'p1': seeds[0], 'p2': seeds[3], 'score1': None, 'score2': None},
-            {'p1': seeds[1], 'p2': seeds[2], 'score1': None, 'score2': None},
-        ]
-    elif m == 5:
-        playins = [
-            {'p1': seeds[3], 'p2': seeds[4], 'score1': None, 'score2': None}
-        ]
-        sfs = [
-            {
-                'p1': seeds[0],
-                'p2': f"Winner of {seeds[3]} vs {seeds[4]}",
-                'score1': None,
-                'score2': None,
-            },
-            {'p1': seeds[1], 'p2': seeds[2], 'score1': None, 'score2': None},
-        ]
-    elif m == 7:
-        qfs = [
-            {'p1': seeds[1], 'p2': seeds[6], 'score1': None, 'score2': None},
-            {'p1': seeds[2], 'p2': seeds[5], 'score1': None, 'score2': None},
-            {'p1': seeds[3], 'p2': seeds[4], 'score1': None, 'score2': None},
-        ]
-        sfs = [
-            {'p1': seeds[0], 'p2': None, 'score1': None, 'score2': None},
-            {'p1': None, 'p2': None, 'score1': None, 'score2': None},
-        ]
-    elif m == 8:
-        qfs = [
-            {'p1': seeds[0], 'p2': seeds[7], 'score1': None, 'score2': None},
-            {'p1': seeds[1], 'p2': seeds[6], 'score1': None, 'score2': None},
-            {'p1': seeds[2], 'p2': seeds[5], 'score1': None, 'score2': None},
-            {'p1': seeds[3], 'p2': seeds[4], 'score1': None, 'score2': None},
-        ]
-        sfs = [
-            {'p1': None, 'p2': None, 'score1': None, 'score2': None},
-            {'p1': None, 'p2': None, 'score1': None, 'score2': None},
-        ]
-    elif m == 10:
-        playins = [
-            {'p1': seeds[6], 'p2': seeds[9], 'score1': None, 'score2': None},
-            {'p1': seeds[7], 'p2': seeds[8], 'score1': None, 'score2': None},
-        ]
-        qfs = [
-            {'p1': seeds[0], 'p2': f"Winner of {seeds[7]} vs {seeds[8]}", 'score1': None, 'score2': None},
-            {'p1': seeds[1], 'p2': f"Winner of {seeds[6]} vs {seeds[9]}", 'score1': None, 'score2': None},
-            {'p1': seeds[2], 'p2': seeds[5], 'score1': None, 'score2': None},
-            {'p1': seeds[3], 'p2': seeds[4], 'score1': None, 'score2': None},
-        ]
-        sfs = [
-            {'p1': None, 'p2': None, 'score1': None, 'score2': None},
-            {'p1': None, 'p2': None, 'score1': None, 'score2': None},
-        ]
-    elif m == 12:
-        playins = [
-            {'p1': seeds[5], 'p2': seeds[10], 'score1': None, 'score2': None},
-            {'p1': seeds[6], 'p2': seeds[9], 'score1': None, 'score2': None},
-            {'p1': seeds[7], 'p2': seeds[8], 'score1': None, 'score2': None},
-            {'p1': seeds[11], 'p2': seeds[4], 'score1': None, 'score2': None},
-        ]
-        qfs = [
-            {'p1': seeds[0], 'p2': f"Winner of {seeds[7]} vs {seeds[8]}", 'score1': None, 'score2': None},
-            {'p1': seeds[1], 'p2': f"Winner of {seeds[6]} vs {seeds[9]}", 'score1': None, 'score2': None},
-            {'p1': seeds[2], 'p2': f"Winner of {seeds[5]} vs {seeds[10]}", 'score1': None, 'score2': None},
-            {'p1': seeds[3], 'p2': f"Winner of {seeds[11]} vs {seeds[4]}", 'score1': None, 'score2': None},
-        ]
-        sfs = [
-            {'p1': None, 'p2': None, 'score1': None, 'score2': None},
-            {'p1': None, 'p2': None, 'score1': None, 'score2': None},
-        ]
-
-    final = {'p1': 'Winner of Semifinal 1', 'p2': 'Winner of Semifinal 2', 'score1': None, 'score2': None}
-
-    if playins:
-        bracket['playins'] = playins
-    if qfs:
-        bracket['qfs'] = qfs
-    if sfs:
-        bracket['sfs'] = sfs
-    bracket['final'] = final
-    return bracket
+def _compute_knockout_bracket(data):
+    """Create a knockout bracket seeded from the group rankings."""
+    rankings = [g['ranked'] for g in data['groups']]
+    return build_bracket(knockout_seeds(rankings, data.get('advance')))
 
 
 def _update_knockout_progress(bracket):
-    """Fill next round matchups based on completed scores."""
+    """Fill next round matchups based on completed scores.
+
+    Only used for brackets stored before brackets became linked graphs
+    (those without a ``layout``); graph brackets move winners on as each
+    result is recorded."""
     if bracket is None:
         return
 
@@ -440,54 +556,288 @@ def _update_knockout_progress(bracket):
         bracket['final']['p2'] = winners_sf[1]
 
 
-def _players_known(match):
-    """Return True if both players have been decided."""
-    p1 = match.get('p1')
-    p2 = match.get('p2')
-    if not p1 or not p2:
+def _record_group(group, pending, index, score1, score2):
+    """Record a group result into ``pending`` without touching the cache.
+
+    ``pending`` maps group names to ``(table, matches)``: a StandingsTable
+    of the whole group and the changed matches by index, both starting from
+    the cached state. Returns False when the match does not exist."""
+    if not 0 <= index < len(group['schedule']):
         return False
-    return not str(p1).startswith('Winner') and not str(p2).startswith('Winner')
+    table, matches = pending.get(group['name']) or (group['table'].copy(), {})
+    match = matches.get(index) or dict(group['schedule'][index])
+    if (match['score1'], match['score2']) == (score1, score2):
+        return True
+    table.revert(match['p1'], match['p2'], match['score1'], match['score2'])
+    match['score1'], match['score2'] = score1, score2
+    table.apply(match['p1'], match['p2'], score1, score2)
+    matches[index] = match
+    pending[group['name']] = (table, matches)
+    return True
+
+
+def _with_pending(data, pending):
+    """``data`` with the pending group results applied and re-ranked."""
+    groups = []
+    for group in data['groups']:
+        if group['name'] in pending:
+            table, matches = pending[group['name']]
+            schedule = [matches.get(i, m) for i, m in enumerate(group['schedule'])]
+            group = dict(group, schedule=schedule, table=table, ranked=table.ranked())
+        groups.append(group)
+    return dict(data, groups=groups)
+
+
+def _open_bracket(data):
+    """A bracket to record knockout results on, from the cached state.
+
+    Returns ``(bracket, is_new, previous)``. A bracket that is not stored yet
+    is derived from the standings; ``previous`` is the cached copy of an old
+    bracket without a layout, which is saved as a diff against it."""
+    bracket = data.get('knockout')
+    if bracket is None:
+        return _compute_knockout_bracket(data), True, None
+    previous = bracket if bracket.get('layout') is None else None
+    return copy.deepcopy(bracket), False, previous
 
 
-@app.route('/tournament/<int:t_id>/record/<group>/<int:index>', methods=['POST'])
-def record_score(t_id: int, group: str, index: int):
-    if not flask_login.current_user.is_authenticated:
-        return redirect(url_for('tournament_view', t_id=t_id))
-    if group != 'A':
-        return redirect(url_for('tournament_view', t_id=t_id))
-
-    conn = get_db()
-    row = conn.execute("SELECT data FROM tournaments WHERE id=?", (t_id,)).fetchone()
-    if row is None:
-        conn.close()
-        return redirect(url_for('index'))
-    data = json.loads(row['data'])
+def _apply_knockout_result(bracket, stage, index, score1, score2):
+    """Record a knockout result on ``bracket`` in memory.
 
-    schedule = data.get('schedule_a')
-    standings = data.get('standings_a')
-    if schedule is None or standings is None or not (0 <= index < len(schedule)):
-        conn.close()
-        return redirect(url_for('tournament_view', t_id=t_id))
+    Returns the list of changed ``(stage, index)`` slots, or ``None`` when the
+    match does not exist or its players are not decided yet."""
+    matches = bracket_matches(bracket, stage) if stage in bracket.get('stages', ()) else []
+    if not 0 <= index < len(matches):
+        return None
+    match = matches[index]
+    if (match.get('score1'), match.get('score2')) == (score1, score2):
+        return []
+    if not players_known(bracket, match):
+        return None
+    if bracket.get('layout') is None:
+        match['score1'], match['score2'] = score1, score2
+        _update_knockout_progress(bracket)
+        # progress may fill any later slot; the save diffs against the original
+        return [(s, i) for s in bracket['stages'] for i in range(len(bracket_matches(bracket, s)))]
+    return record_result(bracket, stage, index, score1, score2)
+
+
+def _plan_results(data, results):
+    """Apply ``(stage, index, score1, score2)`` results to a copy of ``data``.
+
+    Returns ``(pending, knockout, slots, log)``: the group changes as kept
+    by ``_record_group``, the ``_open_bracket`` triple (or ``None``), the
+    changed knockout slots and the results that changed something as
+    ``(stage, index, score1, score2, prev1, prev2)`` for the event log.
+    Raises ``ValueError`` naming the first result that cannot be applied."""
+    groups = {g['name']: g for g in data['groups']}
+    pending = {}
+    knockout = None
+    slots = {}
+    log = []
+    for n, (stage, index, score1, score2) in enumerate(results):
+        if stage in groups:
+            group = groups[stage]
+            before = None
+            if 0 <= index < len(group['schedule']):
+                before = pending.get(stage, (None, {}))[1].get(index) or group['schedule'][index]
+            if not _record_group(group, pending, index, score1, score2):
+                raise ValueError(f'result {n}: no match {stage}/{index}')
+            if (before['score1'], before['score2']) != (score1, score2):
+                log.append((stage, index, score1, score2, before['score1'], before['score2']))
+            continue
+        if knockout is None:
+            # a bracket created by this write is seeded from the new standings
+            knockout = _open_bracket(_with_pending(data, pending) if pending else data)
+            if knockout[0] is None:
+                raise ValueError(f'result {n}: there is no knockout stage yet')
+        matches = bracket_matches(knockout[0], stage) if stage in knockout[0]['stages'] else []
+        prev = (matches[index].get('score1'), matches[index].get('score2')) \
+            if 0 <= index < len(matches) else None
+        changed = _apply_knockout_result(knockout[0], stage, index, score1, score2)
+        if changed is None:
+            raise ValueError(f'result {n}: {stage}/{index} is not a playable match')
+        if changed:
+            log.append((stage, index, score1, score2, *prev))
+        slots.update(dict.fromkeys(changed))
+    return pending, knockout, list(slots), log
+
+
+def _apply_plan(data, pending, knockout, slots, log=()):
+    """The state ``data`` turns into once a plan is saved, ranked again."""
+    new = _with_pending(data, pending)
+    for group in new['groups']:
+        if group['name'] in pending:
+            group['standings'] = [
+                {'name': s.name, 'points': s.points, 'gd': s.gd, 'legs': s.legs}
+                for s in pending[group['name']][0]
+            ]
+    if knockout is not None and slots:
+        new['knockout'] = knockout[0]
+    return new
+
+
+def _stored_state(data):
+    """``data`` without the derived tables and rankings, as kept in snapshots."""
+    return dict(data, groups=[
+        {k: v for k, v in g.items() if k not in ('table', 'ranked')} for g in data['groups']
+    ])
+
+
+def _save_plan(conn, t_id, pending, knockout, slots, log=()):
+    """Write a plan from ``_plan_results``; returns the touched matches."""
+    touched = []
+    for group, (table, matches) in pending.items():
+        names = set()
+        for index, match in matches.items():
+            db.save_match(conn, t_id, group, index, match)
+            names.update((match['p1'], match['p2']))
+            touched.append((group, index))
+        for name in names:
+            db.save_standing(conn, t_id, group, table[name])
+    if knockout is not None and slots:
+        bracket, is_new, previous = knockout
+        if is_new:
+            db.save_knockout(conn, t_id, bracket)
+        elif previous is not None:
+            db.save_knockout(conn, t_id, bracket, previous)
+        else:
+            db.save_slots(conn, t_id, bracket, slots)
+        touched.extend(slots)
+    return touched
 
-    match = schedule[index]
-    _revert_result(match, standings)
 
+def _played(pending, knockout, touched):
+    """``(stage, index, p1, p2, score1, score2)`` of the touched matches."""
+    played = []
+    for stage, index in touched:
+        if stage in pending:
+            m = pending[stage][1][index]
+        else:
+            m = bracket_matches(knockout[0], stage)[index]
+            if not players_known(knockout[0], m):
+                m = {}
+        played.append((stage, index, *(m.get(k) for k in ('p1', 'p2', 'score1', 'score2'))))
+    return played
+
+
+def _log_results(conn, t_id, revision, data, plan, kind, ref):
+    """Append a write to the event log and snapshot the state when due.
+
+    The first logged write also stores the state it started from, so the
+    history of tournaments created before the log starts there."""
+    fmt = app.config['SNAPSHOT_FORMAT']
+    snapshot, since = db.snapshot_revision(conn, t_id)
+    if snapshot is None:
+        db.save_snapshot(conn, t_id, revision, _stored_state(data), fmt)
+    db.append_events(conn, t_id, revision + 1, kind, plan[3], ref)
+    if since + len(plan[3]) >= app.config['SNAPSHOT_EVERY']:
+        db.save_snapshot(conn, t_id, revision + 1, _stored_state(_apply_plan(data, *plan)), fmt)
+
+
+def _write_results(t_id, results, kind='score', ref=None):
+    """Record results with optimistic concurrency and return the new revision.
+
+    Results are worked out against the cached state at some revision without
+    holding any lock. The write then runs in a short ``BEGIN IMMEDIATE``
+    transaction whose compare-and-swap on the revision fails if another
+    scorer got in first, in which case everything is redone from the fresh
+    state. After ``WRITE_RETRIES`` conflicts the last attempt reads under the
+    write lock, so a result is never dropped. Every write is appended to the
+    event log as ``kind`` (``ref`` is the revision an undo takes back).
+    Returns ``None`` when nothing changed; raises ``LookupError`` for an
+    unknown tournament and ``ValueError`` for a bad result."""
+    conn = get_db()
+    retries = app.config['WRITE_RETRIES']
+    for attempt in range(retries + 1):
+        locked = attempt == retries
+        if locked:
+            db.begin_write(conn)
+            revision = db.get_revision(conn, t_id)
+            found = (revision, db.load_tournament(conn, t_id)) if revision is not None else None
+            if found is not None:
+                _rank_groups(found[1][1])
+        else:
+            found = _load_state_at(t_id)
+        try:
+            if found is None:
+                raise LookupError(t_id)
+            revision, (_, data) = found
+            plan = _plan_results(data, results)
+            if not plan[3]:
+                conn.rollback()
+                return None
+            if not locked:
+                db.begin_write(conn)
+            db.bump_revision(conn, t_id, revision)
+            db.restore_tournament(conn, t_id)
+            touched = _save_plan(conn, t_id, *plan)
+            db.index_results(conn, t_id, _played(plan[0], plan[1], touched), k=app.config['ELO_K'])
+            _log_results(conn, t_id, revision, data, plan, kind, ref)
+            conn.commit()
+        except db.RevisionConflict:
+            conn.rollback()
+            continue
+        except BaseException:
+            conn.rollback()
+            raise
+        # the written state is cached as it is, so nothing is loaded or ranked again
+        state_cache.put(t_id, revision + 1, (found[1][0], _apply_plan(data, *plan)))
+        # a fresh entry, so a render of the old revision cannot be stored over it
+        html_cache.put(t_id, revision + 1, {})
+        if broker.has_subscribers(t_id):
+            broker.publish(t_id, 'score', _results_delta(t_id, revision + 1, touched), revision + 1)
+        return revision + 1
+
+
+def _results_delta(t_id, revision, touched):
+    """The changed matches, standings of their groups and the champion."""
+    _, data = _load_state(t_id)
+    groups = {g['name']: g for g in data['groups']}
+    bracket = None
+    matches = []
+    standings = {}
+    for stage, index in dict.fromkeys(touched):
+        if stage in groups:
+            m = groups[stage]['schedule'][index]
+            standings[stage] = _ranked_json(groups[stage])
+        else:
+            bracket = bracket or _display_bracket(data)
+            m = bracket_matches(bracket, stage)[index]
+        matches.append({
+            'stage': stage, 'index': index,
+            **{k: m.get(k) for k in ('p1', 'p2', 'score1', 'score2')},
+        })
+    delta = {'revision': revision, 'matches': matches, 'standings': standings}
+    if bracket is not None:
+        delta['champion'] = db.champion(bracket)
+    return delta
+
+
+def _form_result(stage, index):
+    """The single result posted by the score forms, or ``None``.
+
+    Checked by ``_parse_results`` like a result posted to the JSON API."""
     try:
-        match['score1'] = int(request.form.get('score1'))
-        match['score2'] = int(request.form.get('score2'))
+        score1, score2 = int(request.form.get('score1')), int(request.form.get('score2'))
+        return _parse_results([[stage, index, score1, score2]])
     except (TypeError, ValueError):
-        match['score1'] = match['score2'] = None
-        conn.close()
-        return redirect(url_for('tournament_view', t_id=t_id))
+        return None
 
-    _apply_result(match, standings)
 
-    conn.execute(
-        "UPDATE tournaments SET data=? WHERE id=?",
-        (json.dumps(data), t_id),
-    )
-    conn.commit()
-    conn.close()
+@app.route('/tournament/<int:t_id>/record/<group>/<int:index>', methods=['POST'])
+def record_score(t_id: int, group: str, index: int):
+    if not flask_login.current_user.is_authenticated:
+        return redirect(url_for('tournament_view', t_id=t_id))
+
+    results = _form_result(group, index)
+    if results is not None:
+        try:
+            _write_results(t_id, results)
+        except LookupError:
+            return redirect(url_for('index'))
+        except ValueError:
+            pass
     return redirect(url_for('tournament_view', t_id=t_id))
 
 
@@ -496,50 +846,439 @@ def record_knockout_score(t_id: int, stage: str, index: int):
     if not flask_login.current_user.is_authenticated:
         return redirect(url_for('knockout_view', t_id=t_id))
 
-    conn = get_db()
-    row = conn.execute("SELECT data FROM tournaments WHERE id=?", (t_id,)).fetchone()
-    if row is None:
-        conn.close()
-        return redirect(url_for('index'))
-    data = json.loads(row['data'])
+    results = _form_result(stage, index)
+    if results is not None:
+        try:
+            _write_results(t_id, results)
+        except LookupError:
+            return redirect(url_for('index'))
+        except ValueError:
+            pass
+    return redirect(url_for('knockout_view', t_id=t_id))
 
+
+def _parse_results(payload):
+    """Validate a batch of results posted as JSON.
+
+    Accepts ``{"results": [...]}`` or a bare list whose items are either
+    ``[stage, index, score1, score2]`` or objects with those keys. Returns a
+    list of tuples and raises ``ValueError`` naming the first bad item."""
+    items = payload.get('results') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise ValueError('expected a non-empty list of results')
+    results = []
+    for n, item in enumerate(items):
+        if isinstance(item, dict):
+            item = [item.get(k) for k in ('stage', 'index', 'score1', 'score2')]
+        if not isinstance(item, (list, tuple)) or len(item) != 4:
+            raise ValueError(f'result {n}: expected stage, index, score1 and score2')
+        stage, index, score1, score2 = item
+        if not isinstance(stage, str) or not all(
+            isinstance(v, int) and not isinstance(v, bool) for v in (index, score1, score2)
+        ):
+            raise ValueError(f'result {n}: stage must be a string, index and scores integers')
+        if score1 < 0 or score2 < 0:
+            raise ValueError(f'result {n}: scores cannot be negative')
+        if score1 > MAX_SCORE or score2 > MAX_SCORE:
+            raise ValueError(f'result {n}: scores cannot be above {MAX_SCORE}')
+        results.append((stage, index, score1, score2))
+    return results
+
+
+def _display_bracket(data):
+    """The bracket as shown to viewers, without persisting anything.
+
+    The bracket is derived from the standings until the first knockout score
+    stores it. Old brackets without a layout have their progress recomputed
+    on a copy so the cached state is left untouched."""
     bracket = data.get('knockout')
     if bracket is None:
-        standings = data.get('standings_a', [])
-        standings = sorted(standings, key=lambda x: (-x['points'], -x['gd']))
-        bracket = _compute_knockout_bracket(standings)
-        data['knockout'] = bracket
-
-    if stage == 'final':
-        match = bracket['final']
-    elif stage in ('playins', 'qfs', 'sfs'):
-        matches = bracket.get(stage)
-        if matches is None or not (0 <= index < len(matches)):
-            conn.close()
-            return redirect(url_for('knockout_view', t_id=t_id))
-        match = matches[index]
-    else:
-        conn.close()
-        return redirect(url_for('knockout_view', t_id=t_id))
+        return _compute_knockout_bracket(data)
+    if bracket.get('layout') is None:
+        bracket = copy.deepcopy(bracket)
+        _update_knockout_progress(bracket)
+    return bracket
 
-    if stage in ('sfs', 'final') and not _players_known(match):
-        conn.close()
-        return redirect(url_for('knockout_view', t_id=t_id))
 
+def _ranked_json(group):
+    return [
+        {'name': s.name, 'points': s.points, 'gd': s.gd, 'legs': s.legs}
+        for s in group['ranked']
+    ]
+
+
+def _standings_json(data):
+    return {group['name']: _ranked_json(group) for group in data['groups']}
+
+
+def _bracket_json(bracket):
+    if bracket is None:
+        return None
+    stages = []
+    for stage in bracket['stages']:
+        stages.append({
+            'stage': stage,
+            'title': stage_title(stage),
+            'matches': [
+                {k: m.get(k) for k in ('p1', 'p2', 'score1', 'score2')}
+                for m in bracket_matches(bracket, stage)
+            ],
+        })
+    return {'size': bracket['size'], 'stages': stages, 'champion': db.champion(bracket)}
+
+
+def _schedule_json(group):
+    return [
+        {'index': i, **{k: m.get(k) for k in ('round', 'p1', 'p2', 'score1', 'score2')}}
+        for i, m in enumerate(group['schedule'])
+    ]
+
+
+def state_etag(t_id, revision):
+    return f"t{t_id}-r{revision}"
+
+
+def _state_payload(t_id, name, revision, data):
+    return {
+        'id': t_id,
+        'name': name,
+        'revision': revision,
+        'players': data['players'],
+        'groups': [
+            {'name': g['name'], 'schedule': _schedule_json(g)} for g in data['groups']
+        ],
+        'standings': _standings_json(data),
+        'knockout': _bracket_json(_display_bracket(data)),
+    }
+
+
+def tournament_state(t_id, if_none_match=None):
+    """Read-API state of a tournament; needs an app context.
+
+    Returns ``(etag, payload)`` or ``None`` if the tournament does not exist.
+    ``payload`` is ``None`` when ``if_none_match`` (werkzeug ``ETags``)
+    already holds the current ETag, in which case only the revision is read.
+    Shared by the Flask route and the ASGI server in ``asgi.py``."""
+    revision = db.get_revision(get_db(), t_id)
+    if revision is None:
+        return None
+    if if_none_match is not None and if_none_match.contains(state_etag(t_id, revision)):
+        return state_etag(t_id, revision), None
+
+    found = _load_state_at(t_id)
+    if found is None:
+        return None
+    revision, (name, data) = found
+    return state_etag(t_id, revision), _state_payload(t_id, name, revision, data)
+
+
+def _replay(data, events):
+    """Apply logged results to a snapshot, one write at a time."""
+    _rank_groups(data)
+    for _, batch in itertools.groupby(events, key=lambda e: e['revision']):
+        plan = _plan_results(data, [(e['stage'], e['idx'], e['score1'], e['score2']) for e in batch])
+        data = _apply_plan(data, *plan)
+    return data
+
+
+def _state_at(t_id, revision):
+    """``(name, data)`` as it was at ``revision``, or ``None``.
+
+    Past states are rebuilt from the latest snapshot at or before
+    ``revision`` plus the events logged after it. ``None`` also means the
+    history does not reach back that far."""
+    found = _load_state_at(t_id)
+    if found is None or revision > found[0]:
+        return None
+    if revision == found[0]:
+        return found[1]
+    history = db.load_history(get_db(), t_id, revision)
+    if history is None:
+        return None
+    _, data, events = history
+    return found[1][0], _replay(data, events)
+
+
+def _diff_results(data, target):
+    """Results that turn the scores of ``data`` into those of ``target``.
+
+    Knockout results come in stage order, so an earlier round is put back
+    before the matches its winners play in."""
+    results = []
+    for group, old in zip(data['groups'], target['groups']):
+        for i, (m, t) in enumerate(zip(group['schedule'], old['schedule'])):
+            if (m['score1'], m['score2']) != (t['score1'], t['score2']):
+                results.append((group['name'], i, t['score1'], t['score2']))
+    bracket, old = data.get('knockout'), target.get('knockout')
+    if bracket is not None:
+        for stage in bracket['stages']:
+            past = bracket_matches(old, stage) if old and stage in old['stages'] else []
+            for i, m in enumerate(bracket_matches(bracket, stage)):
+                t = past[i] if i < len(past) else {}
+                if (m.get('score1'), m.get('score2')) != (t.get('score1'), t.get('score2')):
+                    results.append((stage, i, t.get('score1'), t.get('score2')))
+    return results
+
+
+def _undo(t_id):
+    """Take back the latest score write that is not undone yet.
+
+    The scores are set back to the state before that write, as a new write
+    logged with kind ``undo``. Returns the new revision, or ``None`` when
+    there is nothing to undo."""
+    target = db.undo_target(get_db(), t_id)
+    if target is None:
+        return None
+    before = _state_at(t_id, target - 1)
+    current = _load_state(t_id)
+    if before is None or current is None:
+        return None
+    results = _diff_results(current[1], before[1])
+    return _write_results(t_id, results, kind='undo', ref=target) if results else None
+
+
+@app.route('/api/tournament/<int:t_id>')
+def api_tournament(t_id: int):
+    """Schedule, standings and bracket of a tournament as JSON.
+
+    The strong ETag changes with the revision, so clients polling with
+    ``If-None-Match`` get an empty ``304`` until something is recorded.
+    ``?revision=N`` returns the tournament as it was at revision ``N``."""
+    revision = request.args.get('revision', type=int)
+    if revision is not None:
+        past = _state_at(t_id, revision)
+        if past is None:
+            return jsonify(error='revision not available'), 404
+        response = jsonify(_state_payload(t_id, past[0], revision, past[1]))
+        response.set_etag(state_etag(t_id, revision))
+        response.cache_control.max_age = 3600
+        return response
+
+    found = tournament_state(t_id, request.if_none_match)
+    if found is None:
+        return jsonify(error='tournament not found'), 404
+    etag, payload = found
+    response = jsonify(payload) if payload is not None else app.response_class(status=304)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+# (t_id, revision) -> Future of an odds simulation in progress
+_odds_running = {}
+_odds_lock = threading.Lock()
+
+
+def tournament_odds(t_id):
+    """Simulated qualification, seed and title chances at the current revision.
+
+    The simulation is seeded with the revision and cached per revision, so
+    repeated requests between two results return the same numbers. It runs
+    once per revision: requests arriving while it runs wait for its result.
+    Returns ``None`` for an unknown tournament."""
+    found = _load_state_at(t_id)
+    if found is None:
+        return None
+    revision, (_, data) = found
+    odds = odds_cache.get(t_id, revision)
+    if odds is not None:
+        return odds
+    with _odds_lock:
+        odds = odds_cache.get(t_id, revision)
+        if odds is not None:
+            return odds
+        running = _odds_running.get((t_id, revision))
+        if running is None:
+            _odds_running[t_id, revision] = future = Future()
+    if running is not None:
+        return running.result()
     try:
-        match['score1'] = int(request.form.get('score1'))
-        match['score2'] = int(request.form.get('score2'))
-    except (TypeError, ValueError):
-        match['score1'] = match['score2'] = None
-        conn.close()
+        player_ratings = db.player_ratings(get_db(), data['players'])
+        odds = simulate.simulate(data, player_ratings, app.config['SIMULATION_RUNS'], revision)
+        odds['revision'] = revision
+        odds_cache.put(t_id, revision, odds)
+        future.set_result(odds)
+        return odds
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _odds_lock:
+            del _odds_running[t_id, revision]
+
+
+@app.route('/api/tournament/<int:t_id>/odds')
+def api_odds(t_id: int):
+    odds = tournament_odds(t_id)
+    if odds is None:
+        return jsonify(error='tournament not found'), 404
+    response = jsonify(odds)
+    response.set_etag(state_etag(t_id, odds['revision']) + '-odds')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/api/tournament/<int:t_id>/history')
+def api_history(t_id: int):
+    """The logged results of a tournament, oldest first.
+
+    ``?after=<seq>`` continues from an earlier page."""
+    conn = get_db()
+    if db.get_revision(conn, t_id) is None:
+        return jsonify(error='tournament not found'), 404
+    after = request.args.get('after', 0, type=int)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 500)
+    return jsonify(events=db.list_events(conn, t_id, after, limit))
+
+
+@app.route('/api/tournament/<int:t_id>/undo', methods=['POST'])
+def api_undo(t_id: int):
+    if not flask_login.current_user.is_authenticated:
+        return jsonify(error='login required'), 401
+    try:
+        revision = _undo(t_id)
+    except LookupError:
+        return jsonify(error='tournament not found'), 404
+    if revision is None:
+        return jsonify(error='nothing to undo'), 409
+    return jsonify(revision=revision)
+
+
+@app.route('/tournament/<int:t_id>/undo', methods=['POST'])
+def undo_result(t_id: int):
+    if flask_login.current_user.is_authenticated:
+        try:
+            _undo(t_id)
+        except LookupError:
+            return redirect(url_for('index'))
+    if request.form.get('page') == 'knockout':
         return redirect(url_for('knockout_view', t_id=t_id))
+    return redirect(url_for('tournament_view', t_id=t_id))
 
-    _update_knockout_progress(bracket)
 
-    conn.execute("UPDATE tournaments SET data=? WHERE id=?", (json.dumps(data), t_id))
-    conn.commit()
-    conn.close()
-    return redirect(url_for('knockout_view', t_id=t_id))
+@app.route('/api/players')
+def api_players():
+    """The rating list across all tournaments."""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    return jsonify(players=db.player_ranking(get_db(), limit, offset))
+
+
+@app.route('/api/players/<path:name>')
+def api_player(name: str):
+    """A player's rating, tournaments and results, matched on the normalized name."""
+    conn = get_db()
+    player = db.find_player(conn, name)
+    if player is None:
+        return jsonify(error='player not found'), 404
+    limit = request.args.get('limit', type=int)
+    return jsonify(
+        **player,
+        tournaments=db.player_tournaments(conn, player['id']),
+        results=db.player_results(conn, player['id'], limit),
+    )
+
+
+@app.route('/api/tournament/<int:t_id>/scores', methods=['POST'])
+def api_record_scores(t_id: int):
+    """Record many group and knockout results in one transaction.
+
+    Nothing is written unless every result is valid; the response carries
+    the standings and bracket after the batch."""
+    if not flask_login.current_user.is_authenticated:
+        return jsonify(error='login required'), 401
+    try:
+        results = _parse_results(request.get_json(silent=True))
+        _write_results(t_id, results)
+    except LookupError:
+        return jsonify(error='tournament not found'), 404
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+
+    revision, (_, data) = _load_state_at(t_id)
+    return jsonify(
+        revision=revision,
+        applied=len(results),
+        standings=_standings_json(data),
+        knockout=_bracket_json(_display_bracket(data)),
+    )
+
+
+_relay_lock = threading.Lock()
+_relay = None
+
+
+def _relay_revisions():
+    """Pass writes committed by other worker processes to this one's streams.
+
+    Their deltas are not known here, so the new revision is sent as a
+    ``revision`` event and the pages showing an older one reload."""
+    while True:
+        time.sleep(app.config['EVENT_POLL_INTERVAL'])
+        seen = broker.revisions()
+        if not seen:
+            continue
+        try:
+            with app.app_context():
+                current = db.get_revisions(get_db(), seen)
+        except sqlite3.Error:
+            app.logger.exception('polling tournament revisions failed')
+            continue
+        for t_id, revision in current.items():
+            if revision > seen[t_id]:
+                broker.publish(t_id, 'revision', {'revision': revision}, revision)
+
+
+def subscribe_events(t_id, callback, revision):
+    """Subscribe ``callback`` to the events of a tournament shown at ``revision``.
+
+    With ``MULTI_WORKER`` the first subscription starts the thread relaying
+    other workers' writes. Shared with the ASGI server in ``asgi.py``."""
+    global _relay
+    broker.subscribe(t_id, callback, revision)
+    if app.config['MULTI_WORKER']:
+        with _relay_lock:
+            if _relay is None:
+                _relay = threading.Thread(target=_relay_revisions, name='event-relay', daemon=True)
+                _relay.start()
+
+
+@app.route('/tournament/<int:t_id>/events')
+def tournament_events(t_id: int):
+    """Server-Sent Events stream of the results recorded for a tournament.
+
+    The stream opens with the current revision and then carries one
+    ``score`` event per committed write, with the revision as event id.
+    Messages a slow client cannot keep up with are dropped; the client
+    notices the gap in revisions and reloads."""
+    revision = db.get_revision(get_db(), t_id)
+    if revision is None:
+        return jsonify(error='tournament not found'), 404
+    messages = queue.Queue(maxsize=app.config['EVENT_QUEUE_SIZE'])
+    heartbeat = app.config['EVENT_HEARTBEAT']
+
+    def deliver(message):
+        try:
+            messages.put_nowait(message)
+        except queue.Full:
+            pass
+
+    def stream():
+        subscribe_events(t_id, deliver, revision)
+        try:
+            yield format_event('revision', {'revision': revision}, revision)
+            while True:
+                try:
+                    yield messages.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            broker.unsubscribe(t_id, deliver)
+
+    response = app.response_class(stream(), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @app.route('/tournament')
@@ -550,61 +1289,278 @@ def tournament_current():
     return redirect(url_for('tournament_view', t_id=tid))
 
 
+def _html_fragments(t_id, revision):
+    """The dict of rendered HTML cached for ``revision``, or ``None``.
+
+    ``None`` means a newer revision is already cached and renders of this
+    one must not be stored."""
+    fragments = html_cache.get(t_id, revision)
+    if fragments is None:
+        html_cache.put(t_id, revision, {})
+        fragments = html_cache.get(t_id, revision)
+    return fragments
+
+
+def _fragment(fragments, key, template, context):
+    """Render a template partial, reusing ``fragments[key]`` when cached.
+
+    ``context`` is a callable returning the template context, so nothing is
+    prepared for a cached fragment. Partials are rendered straight from the
+    Jinja environment, without the context processors of a page render."""
+    html = fragments.get(key) if fragments is not None else None
+    if html is None:
+        started = time.perf_counter()
+        html = Markup(app.jinja_env.get_template(template).render(**context()))
+        elapsed = time.perf_counter() - started
+        render_seconds.observe(elapsed, template)
+        _add_timing('render', elapsed)
+        if fragments is not None:
+            fragments[key] = html
+    return html
+
+
+def _cached_page(t_id, page):
+    """A spectator page served straight from ``html_cache``.
+
+    Writes in this process replace the cache entry, so a stored page is
+    current without asking the database for the revision. With
+    ``MULTI_WORKER`` another process may have written, so the revision is
+    read after all."""
+    if flask_login.current_user.is_authenticated:
+        return None
+    entry = html_cache.latest(t_id)
+    if entry is None or page not in entry[1]:
+        return None
+    if app.config['MULTI_WORKER'] and db.get_revision(get_db(), t_id) != entry[0]:
+        return None
+    return entry[1][page]
+
+
+def _remember_tournament(t_id):
+    # spectators are not given a session, so reading a page stores nothing
+    if flask_login.current_user.is_authenticated:
+        session['current_tournament_id'] = t_id
+
+
 @app.route('/tournament/<int:t_id>')
 def tournament_view(t_id: int):
-    conn = get_db()
-    row = conn.execute('SELECT name, data FROM tournaments WHERE id=?', (t_id,)).fetchone()
-    conn.close()
-    if row is None:
+    page = _cached_page(t_id, 'groups')
+    if page is not None:
+        return page
+    found = _load_state_at(t_id)
+    if found is None:
         return redirect(url_for('index'))
-    data = json.loads(row['data'])
-    session['current_tournament_id'] = t_id
-    standings_a = data.get('standings_a', [])
-    standings_a = sorted(standings_a, key=lambda x: (-x['points'], -x['gd']))
-
-    schedule_a = data.get('schedule_a', [])
-    rounds = {}
-    for m in schedule_a:
-        rounds.setdefault(m.get('round', 1), []).append(m)
-    schedule_by_round = [rounds[r] for r in sorted(rounds)]
-    return render_template(
+    revision, (_, data) = found
+    _remember_tournament(t_id)
+
+    # standings carry no forms, so admins share the spectators' copy
+    editable = flask_login.current_user.is_authenticated
+    fragments = _html_fragments(t_id, revision)
+    grouped = len(data['groups']) > 1
+    groups = []
+    for group in data['groups']:
+        name = group['name']
+
+        def standings_context(group=group):
+            return {
+                'group': {'name': group['name'], 'standings': group['ranked']},
+                'grouped': grouped,
+            }
+
+        def rounds_context(group=group):
+            rounds = {}
+            for m in group['schedule']:
+                rounds.setdefault(m.get('round', 1), []).append(m)
+            return {
+                'group': {
+                    'name': group['name'],
+                    'schedule_rounds': [rounds[r] for r in sorted(rounds)],
+                },
+                'grouped': grouped,
+                'editable': editable,
+                't_id': t_id,
+            }
+
+        groups.append({
+            'name': name,
+            'standings_html': _fragment(
+                fragments, ('standings', name), '_standings.html', standings_context
+            ),
+            'rounds_html': _fragment(
+                None if editable else fragments, ('rounds', name), '_rounds.html', rounds_context
+            ),
+        })
+    page = render_template(
         'tournament.html',
         players=data.get('players', []),
-        group_a=data.get('group_a', []),
-        schedule_rounds=schedule_by_round,
-        standings_a=standings_a,
+        groups=groups,
         t_id=t_id,
+        revision=revision,
     )
+    if fragments is not None and not editable:
+        fragments['groups'] = page
+    return page
 
 
 @app.route('/tournament/<int:t_id>/knockout')
 def knockout_view(t_id: int):
-    conn = get_db()
-    row = conn.execute('SELECT name, data FROM tournaments WHERE id=?', (t_id,)).fetchone()
-    conn.close()
-    if row is None:
+    page = _cached_page(t_id, 'knockout')
+    if page is not None:
+        return page
+    found = _load_state_at(t_id)
+    if found is None:
         return redirect(url_for('index'))
-    data = json.loads(row['data'])
-    session['current_tournament_id'] = t_id
-    standings_a = data.get('standings_a', [])
-    standings_a = sorted(standings_a, key=lambda x: (-x['points'], -x['gd']))
-
-    bracket = data.get('knockout')
+    revision, (_, data) = found
+    _remember_tournament(t_id)
+
+    editable = flask_login.current_user.is_authenticated
+    fragments = None if editable else _html_fragments(t_id, revision)
+    bracket = _display_bracket(data)
+    stages_html = {}
+    if bracket:
+        labels = slot_labels(bracket)
+        for stage in bracket['stages']:
+            stages_html[stage] = _fragment(
+                fragments, ('stage', stage), '_knockout_stage.html',
+                lambda stage=stage: {
+                    'bracket': bracket, 'labels': labels, 'stage': stage,
+                    'editable': editable, 't_id': t_id,
+                },
+            )
+    page = render_template(
+        'knockout.html', bracket=bracket, stages_html=stages_html, t_id=t_id, revision=revision
+    )
+    if fragments is not None:
+        fragments['knockout'] = page
+    return page
+
+
+def _board_matches(data):
+    """Unplayed matches for ``schedule_boards`` and how to show their players.
+
+    Knockout matches join once the group stage is over or the bracket is
+    stored. A place that is not decided yet waits on the match feeding it;
+    brackets from before the graph layout only add matches whose players
+    are both known. Returns ``(matches, names)`` with ``names`` mapping a
+    match key to its two player labels."""
+    matches, names = [], {}
+    groups_done = True
+    for group in data['groups']:
+        for index, m in enumerate(group['schedule']):
+            if m['score1'] is None or m['score2'] is None:
+                groups_done = False
+                key = (group['name'], index)
+                matches.append(BoardMatch(
+                    key, (m['p1'], m['p2']), order=(0, m.get('round', 1), group['name'], index)
+                ))
+                names[key] = (m['p1'], m['p2'])
+    if data.get('knockout') is None and not groups_done:
+        return matches, names
+    bracket = _display_bracket(data)
     if bracket is None:
-        bracket = _compute_knockout_bracket(standings_a)
-        data['knockout'] = bracket
-        conn = get_db()
-        conn.execute("UPDATE tournaments SET data=? WHERE id=?", (json.dumps(data), t_id))
-        conn.commit()
-        conn.close()
-    else:
-        _update_knockout_progress(bracket)
-        conn = get_db()
-        conn.execute("UPDATE tournaments SET data=? WHERE id=?", (json.dumps(data), t_id))
-        conn.commit()
-        conn.close()
+        return matches, names
+    labels = slot_labels(bracket)
+    feeders = {tuple(m['next']): (stage, j)
+               for stage in bracket['stages']
+               for j, m in enumerate(bracket_matches(bracket, stage)) if m.get('next')}
+    for stage in bracket['stages']:
+        for j, m in enumerate(bracket_matches(bracket, stage)):
+            if match_winner(m) is not None:
+                continue
+            players, after, shown = [], [], []
+            for slot in (1, 2):
+                name = m.get('p1' if slot == 1 else 'p2')
+                if slot_known(bracket, name):
+                    players.append(name)
+                    shown.append(name)
+                elif (stage, j, slot) in feeders:
+                    after.append(feeders[stage, j, slot])
+                    shown.append(labels.get((stage, j, slot), 'TBD'))
+                else:
+                    break
+            else:
+                matches.append(BoardMatch(
+                    (stage, j), tuple(players), tuple(after), (1, stage_rank(stage), j)
+                ))
+                names[stage, j] = tuple(shown)
+    return matches, names
+
+
+def board_plan(t_id, boards, rest):
+    """Plan the remaining matches of a tournament on ``boards`` boards.
+
+    The plan is worked out from the current revision, so it follows the
+    results as they come in, and cached per revision and board setup.
+    Returns ``None`` for an unknown tournament."""
+    found = _load_state_at(t_id)
+    if found is None:
+        return None
+    revision, (_, data) = found
+    plans = plan_cache.get(t_id, revision)
+    if plans is None:
+        plan_cache.put(t_id, revision, {})
+        # stays None when a newer revision is cached already
+        plans = plan_cache.get(t_id, revision)
+    plan = plans.get((boards, rest)) if plans is not None else None
+    if plan is None:
+        plan = _board_plan(data, revision, boards, rest)
+        if plans is not None:
+            plans[boards, rest] = plan
+    return plan
+
+
+def _board_plan(data, revision, boards, rest):
+    matches, names = _board_matches(data)
+    slots, unscheduled = schedule_boards(matches, boards, rest)
+    minutes = app.config['MATCH_MINUTES']
+    groups = {g['name'] for g in data['groups']}
+
+    def show(m, board=None):
+        stage, index = m.key
+        shown = {
+            'stage': stage, 'index': index,
+            'title': f'Group {stage}' if stage in groups else stage_title(stage, singular=True),
+            'p1': names[m.key][0], 'p2': names[m.key][1],
+        }
+        return shown if board is None else {'board': board, **shown}
+
+    return {
+        'revision': revision,
+        'boards': boards,
+        'rest': rest,
+        'match_minutes': minutes,
+        'slots': [
+            {'slot': t + 1, 'starts_after': t * minutes,
+             'matches': [show(m, board) for board, m in enumerate(slot, 1)]}
+            for t, slot in enumerate(slots)
+        ],
+        'makespan': len(slots),
+        'lower_bound': board_lower_bound(matches, boards, rest),
+        'unscheduled': [show(m) for m in unscheduled],
+    }
+
+
+def _board_args():
+    boards = min(max(request.args.get('boards', app.config['BOARDS'], type=int), 1), 64)
+    rest = min(max(request.args.get('rest', app.config['BOARD_REST'], type=int), 0), 8)
+    return boards, rest
 
-    return render_template('knockout.html', bracket=bracket, t_id=t_id)
+
+@app.route('/api/tournament/<int:t_id>/boards')
+def api_boards(t_id: int):
+    """The remaining matches planned on ``?boards=`` boards with ``?rest=`` slots of rest."""
+    plan = board_plan(t_id, *_board_args())
+    if plan is None:
+        return jsonify(error='tournament not found'), 404
+    return jsonify(plan)
+
+
+@app.route('/tournament/<int:t_id>/boards')
+def boards_view(t_id: int):
+    plan = board_plan(t_id, *_board_args())
+    if plan is None:
+        return redirect(url_for('index'))
+    return render_template('boards.html', plan=plan, t_id=t_id)
 
 
 @app.route('/delete/<int:t_id>', methods=['POST'])
@@ -612,15 +1568,98 @@ def delete_tournament(t_id: int):
     if not flask_login.current_user.is_authenticated:
         return redirect(url_for('index'))
     conn = get_db()
-    conn.execute('DELETE FROM tournaments WHERE id=?', (t_id,))
+    db.delete_tournament(conn, t_id)
     conn.commit()
-    conn.close()
+    state_cache.invalidate(t_id)
+    html_cache.invalidate(t_id)
+    odds_cache.invalidate(t_id)
+    plan_cache.invalidate(t_id)
     if session.get('current_tournament_id') == t_id:
         session.pop('current_tournament_id', None)
         session.pop('players', None)
     return redirect(url_for('index'))
 
 
+@app.route('/metrics')
+def metrics_view():
+    return registry.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(state_cache.stats(), html=html_cache.stats())
+
+
+@app.cli.command('archive')
+@click.option('--format', 'fmt', help='Storage format, e.g. json+zlib or msgpack+zstd.')
+@click.option('--recode', is_flag=True, help='Also re-encode archives stored in another format.')
+@click.option('--vacuum', is_flag=True, help='Compact the database file afterwards.')
+def archive_command(fmt, recode, vacuum):
+    """Archive finished tournaments into compressed blobs."""
+    fmt = fmt or app.config['ARCHIVE_FORMAT']
+    try:
+        serialization.check_format(fmt)
+    except ValueError as exc:
+        raise click.BadParameter(str(exc), param_hint='--format')
+    conn = get_db()
+    before = conn.execute('PRAGMA page_count').fetchone()[0]
+    ids = db.archive_candidates(conn, fmt, recode)
+    for t_id in ids:
+        # one short transaction each, so scorers are never held up for long
+        db.begin_write(conn)
+        db.archive_tournament(conn, t_id, fmt)
+        conn.commit()
+    if vacuum:
+        conn.execute('VACUUM')
+    after = conn.execute('PRAGMA page_count').fetchone()[0]
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    click.echo(
+        f"archived {len(ids)} tournament(s) as {fmt}; "
+        f"{before} -> {after} pages ({free} free)"
+    )
+
+
+def _tournament_results(data):
+    """Every played match of a tournament in playing order."""
+    played = []
+    rounds = sorted(
+        (m.get('round', 1), group['name'], index, m)
+        for group in data['groups'] for index, m in enumerate(group['schedule'])
+    )
+    for _, stage, index, m in rounds:
+        played.append((stage, index, m['p1'], m['p2'], m['score1'], m['score2']))
+    if data.get('knockout') is not None:
+        bracket = _display_bracket(data)
+        for stage in bracket['stages']:
+            for index, m in enumerate(bracket_matches(bracket, stage)):
+                if players_known(bracket, m):
+                    played.append((stage, index, m['p1'], m['p2'], m.get('score1'), m.get('score2')))
+    return played
+
+
+@app.cli.command('reindex-players')
+def reindex_players_command():
+    """Rebuild the player index and rate every result again in order."""
+    conn = get_db()
+    db.begin_write(conn)
+    db.reset_player_index(conn)
+    rows = conn.execute('SELECT id, created_at FROM tournaments ORDER BY id').fetchall()
+    for t_id, created_at in rows:
+        _, data = db.load_tournament(conn, t_id)
+        db.index_players(conn, t_id, data['players'])
+        db.index_results(conn, t_id, _tournament_results(data), created_at, app.config['ELO_K'])
+    conn.commit()
+    click.echo(f"indexed {len(rows)} tournament(s)")
+
+
+@app.cli.command('sweep-sessions')
+def sweep_sessions_command():
+    """Delete expired server-side sessions."""
+    store = getattr(app.session_interface, 'store', None)
+    removed = store.sweep() if store is not None else 0
+    click.echo(f"removed {removed} expired session(s)")
+
+
 @app.route('/reset', methods=['POST'])
 def reset():
     session.clear()
@@ -628,6 +1667,5 @@ def reset():
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
-    #Use this for running on network
-    #app.run(debug=True, host='0.0.0.0')
+    # FLASK_RUN_HOST=0.0.0.0 serves other machines on the network, as with `flask run`
+    app.run(debug=True, host=app.config.get('RUN_HOST'), port=app.config.get('RUN_PORT'))
@@ -0,0 +1,254 @@
+"""ASGI entry point for serving many spectators from one process.
+
+Run with::
+
+    uvicorn asgi:application
+
+The JSON read API and the live event streams are served here without
+holding a thread per client: database reads run on a small bounded thread
+pool and an open stream costs one queue until a result is published. Every
+other request, including score entry, goes to the Flask app unchanged on the
+same pool. Live updates are fanned out in-process; to run several workers,
+set ``MULTI_WORKER`` so writes made by the others are picked up.
+"""
+import asyncio
+import io
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.http import parse_etags
+
+import db
+from app import app, broker, request_seconds, subscribe_events, tournament_state
+from broker import format_event
+from db import get_db
+
+app.config.setdefault('ASGI_THREADS', db.POOL_SIZE)
+
+_API_STATE = re.compile(r'/api/tournament/(\d+)')
+_EVENTS = re.compile(r'/tournament/(\d+)/events')
+
+executor = ThreadPoolExecutor(app.config['ASGI_THREADS'], thread_name_prefix='asgi')
+
+
+async def _run(func, *args):
+    """Run ``func`` inside a Flask app context on the bounded pool."""
+    def call():
+        with app.app_context():
+            return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def _respond(send, status, headers=(), body=b''):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _json_error(send, status, message):
+    body = app.json.dumps({'error': message}).encode()
+    await _respond(send, status, [('content-type', 'application/json')], body)
+
+
+async def api_state(scope, send, t_id):
+    started = time.perf_counter()
+    status = await _api_state(scope, send, t_id)
+    request_seconds.observe(
+        time.perf_counter() - started, scope['method'], '/api/tournament/<int:t_id>', str(status)
+    )
+
+
+async def _api_state(scope, send, t_id):
+    etags = parse_etags(_header(scope, b'if-none-match'))
+
+    def read():
+        found = tournament_state(t_id, etags)
+        if found is None or found[1] is None:
+            return found
+        return found[0], app.json.dumps(found[1]).encode()
+
+    found = await _run(read)
+    if found is None:
+        await _json_error(send, 404, 'tournament not found')
+        return 404
+    etag, body = found
+    headers = [('etag', f'"{etag}"'), ('cache-control', 'no-cache')]
+    if body is None:
+        await _respond(send, 304, headers)
+        return 304
+    headers.append(('content-type', 'application/json'))
+    await _respond(send, 200, headers, b'' if scope['method'] == 'HEAD' else body)
+    return 200
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def events(scope, receive, send, t_id):
+    """The event stream of ``app.tournament_events`` on the event loop.
+
+    The broker calls back on the publishing thread; messages are handed to
+    the loop with ``call_soon_threadsafe`` and dropped when a client's queue
+    is full, which the client detects as a gap in revisions."""
+    revision = await _run(lambda: db.get_revision(get_db(), t_id))
+    if revision is None:
+        await _json_error(send, 404, 'tournament not found')
+        return
+
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue(maxsize=app.config['EVENT_QUEUE_SIZE'])
+    heartbeat = app.config['EVENT_HEARTBEAT']
+
+    def offer(message):
+        if not messages.full():
+            messages.put_nowait(message)
+
+    def deliver(message):
+        try:
+            loop.call_soon_threadsafe(offer, message)
+        except RuntimeError:
+            # the loop has shut down
+            pass
+
+    subscribe_events(t_id, deliver, revision)
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        message = format_event('revision', {'revision': revision}, revision)
+        while True:
+            await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+            get = asyncio.ensure_future(messages.get())
+            done, _ = await asyncio.wait(
+                {get, disconnected}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED
+            )
+            if get in done:
+                message = get.result()
+                continue
+            get.cancel()
+            if disconnected.done():
+                return
+            message = ': keep-alive\n\n'
+    except OSError:
+        # the client went away while we were writing
+        pass
+    finally:
+        broker.unsubscribe(t_id, deliver)
+        disconnected.cancel()
+
+
+def _environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1])
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ('; ' if name == 'HTTP_COOKIE' else ',') + value
+        environ[name] = value
+    return environ
+
+
+def _call_wsgi(environ):
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]), headers]
+
+    result = app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started[0], started[1], body
+
+
+async def flask(scope, receive, send):
+    """Hand a request to the Flask app on the thread pool.
+
+    Responses are buffered, which suits every Flask route apart from the
+    event stream that is served natively above."""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    environ = _environ(scope, b''.join(chunks))
+    status, headers, body = await asyncio.get_running_loop().run_in_executor(
+        executor, _call_wsgi, environ
+    )
+    await _respond(send, status, headers, body)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    path, method = scope['path'], scope['method']
+    if method in ('GET', 'HEAD'):
+        match = _API_STATE.fullmatch(path)
+        # past revisions (?revision=N) are rebuilt by the Flask route
+        if match and not scope['query_string']:
+            await api_state(scope, send, int(match.group(1)))
+            return
+        match = _EVENTS.fullmatch(path)
+        if match and method == 'GET':
+            await events(scope, receive, send, int(match.group(1)))
+            return
+    await flask(scope, receive, send)
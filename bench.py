@@ -0,0 +1,260 @@
+"""Benchmarks for the web routes and the tournament engine.
+
+Run with::
+
+    python bench.py --tournaments 30 --players 16 --groups 2 --output bench.json
+
+A temporary ``tournaments.db`` is seeded with finished group stages through
+the Flask test client, then every route is driven the same way a browser
+would. Spectator pages are timed separately from admin pages because only
+the former are served from the HTML cache. Engine functions are timed
+directly. Results are written as JSON; pass ``--compare`` with the output
+of another run to list benchmarks that got slower, for example between two
+branches. The exit status is 1 when any of them did.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import db
+
+
+def _summary(samples, started, finished):
+    samples = sorted(samples)
+    ms = [s * 1000 for s in samples]
+    return {
+        'n': len(samples),
+        'mean_ms': round(statistics.fmean(ms), 4),
+        'median_ms': round(statistics.median(ms), 4),
+        'p95_ms': round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        'min_ms': round(ms[0], 4),
+        'max_ms': round(ms[-1], 4),
+        'ops_per_s': round(len(samples) / (finished - started), 1),
+    }
+
+
+def measure(func, number, warmup=3):
+    """Call ``func(i)`` ``number`` times and summarise the latencies."""
+    for i in range(warmup):
+        func(i)
+    samples = []
+    started = time.perf_counter()
+    for i in range(number):
+        t = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - t)
+    return _summary(samples, started, time.perf_counter())
+
+
+def _login(client):
+    response = client.post('/login', data={'username': 'admin', 'password': 'password'})
+    assert response.status_code == 302, response.status_code
+
+
+def _check(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f"{response.request.path}: HTTP {response.status_code}")
+    return response
+
+
+def seed(client, tournaments, players, groups, rng):
+    """Create ``tournaments`` tournaments with every group match played.
+
+    Returns their ids, oldest first."""
+    ids = []
+    for n in range(tournaments):
+        names = [f"Player {n:03d}-{p:03d}" for p in range(players)]
+        _check(client.post('/start', data={
+            'players_json': json.dumps(names),
+            'groups': groups,
+            'title': f"Bench {n:03d}",
+        }))
+        with client.session_transaction() as sess:
+            t_id = sess['current_tournament_id']
+        state = _check(client.get(f'/api/tournament/{t_id}')).get_json()
+        results = [
+            [group['name'], m['index'], *rng.choice(((3, 0), (3, 1), (3, 2), (2, 3), (1, 3), (0, 3)))]
+            for group in state['groups'] for m in group['schedule']
+        ]
+        _check(client.post(f'/api/tournament/{t_id}/scores', json={'results': results}))
+        ids.append(t_id)
+    return ids
+
+
+def _playable(client, t_id):
+    """The first knockout match whose players are both known."""
+    bracket = _check(client.get(f'/api/tournament/{t_id}')).get_json()['knockout']
+    for stage in bracket['stages']:
+        for index, m in enumerate(stage['matches']):
+            if m['p1'] and m['p2']:
+                return stage['stage'], index
+    raise RuntimeError(f"tournament {t_id} has no playable knockout match")
+
+
+def bench_routes(app, ids, number):
+    spectator = app.test_client()
+    admin = app.test_client()
+    _login(admin)
+    first, last = ids[0], ids[-1]
+    pick = lambda i: ids[i % len(ids)]
+    scores = ((3, 1), (1, 3))
+    stage, index = _playable(admin, last)
+
+    def record_score(i):
+        s1, s2 = scores[i % 2]
+        _check(admin.post(f'/tournament/{first}/record/A/0',
+                          data={'score1': s1, 'score2': s2}), 302)
+
+    def record_knockout_score(i):
+        s1, s2 = scores[i % 2]
+        _check(admin.post(f'/tournament/{last}/record_knockout/{stage}/{index}',
+                          data={'score1': s1, 'score2': s2}), 302)
+
+    cases = {
+        'index': lambda i: _check(spectator.get('/')),
+        'tournament_view': lambda i: _check(spectator.get(f'/tournament/{pick(i)}')),
+        'tournament_view.admin': lambda i: _check(admin.get(f'/tournament/{pick(i)}')),
+        'knockout_view': lambda i: _check(spectator.get(f'/tournament/{pick(i)}/knockout')),
+        'knockout_view.admin': lambda i: _check(admin.get(f'/tournament/{pick(i)}/knockout')),
+        'api_tournament': lambda i: _check(spectator.get(f'/api/tournament/{pick(i)}')),
+        'record_score': record_score,
+        'record_knockout_score': record_knockout_score,
+    }
+    return {f'route.{name}': measure(func, number) for name, func in cases.items()}
+
+
+def bench_engine(players, groups, number, rng):
+    import app as web
+    from tournament import StandingsTable, draw_groups, schedule_round_robin
+
+    names = [f"Player {p:03d}" for p in range(players)]
+    drawn = draw_groups(names, groups)
+    data = {'groups': [], 'advance': None}
+    for name, members in drawn.items():
+        table = StandingsTable(members)
+        for m in schedule_round_robin(members):
+            table.apply(m.p1, m.p2, *rng.choice(((3, 1), (1, 3), (2, 2))))
+        data['groups'].append({'name': name, 'ranked': table.ranked()})
+
+    group = drawn['A']
+    table = StandingsTable(group)
+    matches = schedule_round_robin(group)
+    for m in matches:
+        table.apply(m.p1, m.p2, 3, 1)
+
+    def standings_update(i):
+        # correct one result and read the new order, as a score entry does
+        m = matches[i % len(matches)]
+        table.revert(m.p1, m.p2, 3, 1)
+        table.apply(m.p1, m.p2, 1, 3)
+        table.ranked()
+        table.revert(m.p1, m.p2, 1, 3)
+        table.apply(m.p1, m.p2, 3, 1)
+
+    cases = {
+        'schedule_round_robin': lambda i: schedule_round_robin(names),
+        '_compute_knockout_bracket': lambda i: web._compute_knockout_bracket(data),
+        'standings_update': standings_update,
+        'standings_rebuild': lambda i: StandingsTable.from_matches(group, matches).ranked(),
+    }
+    return {f'engine.{name}': measure(func, number) for name, func in cases.items()}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Benchmarks whose median grew by more than ``threshold`` (a ratio)."""
+    slower = []
+    for name, result in current.items():
+        old = baseline.get(name)
+        if old and old['median_ms'] > 0:
+            ratio = result['median_ms'] / old['median_ms']
+            if ratio > threshold:
+                slower.append((name, old['median_ms'], result['median_ms'], ratio))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tournaments', type=int, default=20)
+    parser.add_argument('--players', type=int, default=16)
+    parser.add_argument('--groups', type=int, default=2)
+    parser.add_argument('--number', type=int, default=200, help='timed calls per route')
+    parser.add_argument('--engine-number', type=int, default=2000, help='timed calls per engine benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='median ratio above which a benchmark counts as slower')
+    args = parser.parse_args(argv)
+    if args.players < 4 or args.tournaments < 1:
+        parser.error('need at least one tournament of four players')
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    # must be set before the app module opens the database
+    db.DB_PATH = os.path.join(workdir, 'tournaments.db')
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    try:
+        from app import app
+        app.config['TESTING'] = True
+
+        started = time.perf_counter()
+        admin = app.test_client()
+        _login(admin)
+        ids = seed(admin, args.tournaments, args.players, args.groups, rng)
+        seeded = time.perf_counter() - started
+
+        results = {}
+        results.update(bench_routes(app, ids, args.number))
+        results.update(bench_engine(args.players, args.groups, args.engine_number, rng))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seed_seconds': round(seeded, 3),
+        },
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)['results']
+        slower = compare(baseline, results, args.threshold)
+        for name, old, new, ratio in slower:
+            print(f"slower: {name} {old:.3f} ms -> {new:.3f} ms ({ratio:.2f}x)", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import threading
+
+import serialization
+
+
+def format_event(event, data, event_id=None):
+    """Encode one Server-Sent Events message."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {serialization.json_dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Broker:
+    """In-process fan-out of tournament events.
+
+    Subscribers register a callback per tournament id. ``publish`` encodes an
+    event once and hands the same message to every callback, so a write costs
+    one serialisation however many screens are watching. Callbacks run on the
+    publishing thread and must not block."""
+
+    def __init__(self):
+        self._subscribers = {}
+        # per tournament, the oldest revision a subscriber may still show
+        self._revisions = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, t_id, callback, revision=None):
+        """Add ``callback`` for ``t_id``; ``revision`` is what the subscriber shows."""
+        with self._lock:
+            self._subscribers.setdefault(t_id, set()).add(callback)
+            if revision is not None:
+                seen = self._revisions.get(t_id)
+                self._revisions[t_id] = revision if seen is None else min(seen, revision)
+
+    def unsubscribe(self, t_id, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(t_id)
+            if callbacks is not None:
+                callbacks.discard(callback)
+                if not callbacks:
+                    del self._subscribers[t_id]
+                    self._revisions.pop(t_id, None)
+
+    def has_subscribers(self, t_id):
+        return t_id in self._subscribers
+
+    def publish(self, t_id, event, data, event_id=None):
+        """Send ``data`` to all subscribers of ``t_id``; returns how many."""
+        with self._lock:
+            callbacks = list(self._subscribers.get(t_id, ()))
+            if callbacks and event_id is not None:
+                self._revisions[t_id] = max(self._revisions.get(t_id, event_id), event_id)
+        if not callbacks:
+            return 0
+        message = format_event(event, data, event_id)
+        for callback in callbacks:
+            callback(message)
+        self.published += 1
+        return len(callbacks)
+
+    def revisions(self):
+        """``{t_id: revision}`` of the tournaments with subscribers that
+        were given a revision, as last subscribed or published."""
+        with self._lock:
+            return dict(self._revisions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tournaments': len(self._subscribers),
+                'subscribers': sum(len(c) for c in self._subscribers.values()),
+                'published': self.published,
+            }
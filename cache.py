@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class StateCache:
+    """LRU cache of decoded tournament state.
+
+    Entries are stored per tournament id together with the revision they were
+    loaded at; a lookup for any other revision is a miss. ``maxsize`` bounds
+    the number of tournaments kept and ``ttl`` (seconds, ``None`` to disable)
+    how long an entry may be served."""
+
+    def __init__(self, maxsize=128, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, t_id, revision):
+        with self._lock:
+            entry = self._entries.get(t_id)
+            if entry is not None:
+                rev, stored_at, value = entry
+                expired = self.ttl is not None and time.monotonic() - stored_at > self.ttl
+                if rev == revision and not expired:
+                    self._entries.move_to_end(t_id)
+                    self.hits += 1
+                    return value
+                if expired or rev < revision:
+                    del self._entries[t_id]
+            self.misses += 1
+            return None
+
+    def latest(self, t_id):
+        """``(revision, value)`` of the entry for ``t_id`` or ``None``.
+
+        Does not check the revision against the database; only valid where
+        every write replaces or invalidates the entry in this process."""
+        with self._lock:
+            entry = self._entries.get(t_id)
+            if entry is None or (
+                self.ttl is not None and time.monotonic() - entry[1] > self.ttl
+            ):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(t_id)
+            self.hits += 1
+            return entry[0], entry[2]
+
+    def put(self, t_id, revision, value):
+        with self._lock:
+            entry = self._entries.get(t_id)
+            # a slow reader must not replace state a writer already moved past
+            if entry is not None and entry[0] > revision:
+                return
+            self._entries[t_id] = (revision, time.monotonic(), value)
+            self._entries.move_to_end(t_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, t_id):
+        with self._lock:
+            self._entries.pop(t_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
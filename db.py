@@ -0,0 +1,1153 @@
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import g, has_app_context
+
+import ratings
+import serialization
+from tournament import link_bracket, stage_rank
+
+DB_PATH = "tournaments.db"
+
+# idle connections kept around for reuse between requests
+POOL_SIZE = 8
+
+# per-connection tuning; journal_mode=WAL is persistent and set in init_db
+PRAGMAS = (
+    'PRAGMA foreign_keys = ON',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',
+)
+
+# stages of brackets created before the generic bracket builder
+KNOCKOUT_STAGES = ('playins', 'qfs', 'sfs', 'final')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tournaments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    created_at TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS players (
+    tournament_id INTEGER NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    seed INTEGER,
+    PRIMARY KEY (tournament_id, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS standings (
+    tournament_id INTEGER NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+    grp TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    points INTEGER NOT NULL DEFAULT 0,
+    gd INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tournament_id, grp, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS standings_by_name ON standings (tournament_id, grp, name);
+CREATE TABLE IF NOT EXISTS matches (
+    tournament_id INTEGER NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    round INTEGER NOT NULL DEFAULT 1,
+    p1 TEXT,
+    p2 TEXT,
+    score1 INTEGER,
+    score2 INTEGER,
+    PRIMARY KEY (tournament_id, stage, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS knockout_slots (
+    tournament_id INTEGER NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    p1 TEXT,
+    p2 TEXT,
+    score1 INTEGER,
+    score2 INTEGER,
+    PRIMARY KEY (tournament_id, stage, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS events (
+    tournament_id INTEGER NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    revision INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    ref INTEGER,
+    stage TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    score1 INTEGER,
+    score2 INTEGER,
+    prev1 INTEGER,
+    prev2 INTEGER,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (tournament_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_by_revision ON events (tournament_id, revision);
+CREATE TABLE IF NOT EXISTS snapshots (
+    tournament_id INTEGER NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+    revision INTEGER NOT NULL,
+    data_format TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (tournament_id, revision)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS player_index (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    rating REAL NOT NULL DEFAULT 1500,
+    played INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS player_index_by_rating ON player_index (rating DESC);
+CREATE TABLE IF NOT EXISTS entries (
+    player_id INTEGER NOT NULL REFERENCES player_index(id),
+    tournament_id INTEGER NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+    PRIMARY KEY (player_id, tournament_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_by_tournament ON entries (tournament_id);
+CREATE TABLE IF NOT EXISTS results (
+    tournament_id INTEGER NOT NULL REFERENCES tournaments(id) ON DELETE CASCADE,
+    stage TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    player_id INTEGER NOT NULL REFERENCES player_index(id),
+    opponent_id INTEGER NOT NULL REFERENCES player_index(id),
+    score_for INTEGER NOT NULL,
+    score_against INTEGER NOT NULL,
+    rating_delta REAL NOT NULL,
+    played_at TEXT NOT NULL,
+    PRIMARY KEY (tournament_id, stage, idx, player_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_by_player ON results (player_id, played_at);
+CREATE INDEX IF NOT EXISTS tournaments_by_created ON tournaments (created_at);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_by_expiry ON sessions (expires);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# full-text index over the summary columns, kept in step by triggers; needs
+# an SQLite built with FTS5, search falls back to LIKE scans without it
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tournaments_fts USING fts5(
+    name, player_names, champion,
+    content='tournaments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS tournaments_fts_insert AFTER INSERT ON tournaments BEGIN
+    INSERT INTO tournaments_fts (rowid, name, player_names, champion)
+    VALUES (new.id, new.name, new.player_names, new.champion);
+END;
+CREATE TRIGGER IF NOT EXISTS tournaments_fts_delete AFTER DELETE ON tournaments BEGIN
+    INSERT INTO tournaments_fts (tournaments_fts, rowid, name, player_names, champion)
+    VALUES ('delete', old.id, old.name, old.player_names, old.champion);
+END;
+CREATE TRIGGER IF NOT EXISTS tournaments_fts_update
+AFTER UPDATE OF name, player_names, champion ON tournaments BEGIN
+    INSERT INTO tournaments_fts (tournaments_fts, rowid, name, player_names, champion)
+    VALUES ('delete', old.id, old.name, old.player_names, old.champion);
+    INSERT INTO tournaments_fts (rowid, name, player_names, champion)
+    VALUES (new.id, new.name, new.player_names, new.champion);
+END;
+"""
+
+# ranking weights of the name, player_names and champion columns
+SEARCH_WEIGHTS = (10.0, 4.0, 4.0)
+
+
+# callables taking (statement, seconds), called after every statement run
+# through ``Connection.execute``; the web app uses them for its metrics
+query_hooks = []
+
+
+class TimedConnection(sqlite3.Connection):
+    """A connection that reports each statement and how long it took.
+
+    Only the ``execute`` step is timed; rows fetched lazily afterwards are
+    not. Without hooks the statement runs as usual."""
+
+    def _timed(self, method, sql, *args):
+        if not query_hooks:
+            return method(sql, *args)
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in query_hooks:
+                hook(sql, elapsed)
+
+    def execute(self, sql, *args):
+        return self._timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(super().executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self._timed(super().executescript, sql)
+
+
+def connect(path=None):
+    """Open a tuned connection.
+
+    sqlite3 keeps compiled statements per connection (``cached_statements``),
+    so a pooled connection reuses its prepared statements across requests."""
+    conn = sqlite3.connect(
+        path or DB_PATH, check_same_thread=False, cached_statements=256,
+        factory=TimedConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """A small LIFO pool of connections to one database file."""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return connect(self.path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+
+def get_db():
+    """Return the connection for the current request.
+
+    The first call in a request borrows a connection from the pool and later
+    calls share it; ``close_db`` hands it back when the app context ends.
+    Outside an app context a fresh connection is returned and the caller must
+    close it."""
+    if not has_app_context():
+        return connect()
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
+def _add_column(conn, table, column, decl):
+    """Add ``column`` to ``table`` unless an older database already has it.
+
+    Returns ``True`` when the column was added."""
+    cols = {r['name'] for r in conn.execute(f'PRAGMA table_info({table})')}
+    if column in cols:
+        return False
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+    return True
+
+
+def init_db():
+    conn = connect()
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.executescript(SCHEMA)
+    _add_column(conn, 'tournaments', 'knockout_size', 'INTEGER')
+    _add_column(conn, 'tournaments', 'knockout_layout', 'TEXT')
+    # players per group that reach the knockout; NULL keeps the one-group rules
+    _add_column(conn, 'tournaments', 'advance', 'INTEGER')
+    # bracket graph: the match and slot (1 or 2) a match's winner moves on to
+    _add_column(conn, 'knockout_slots', 'next_stage', 'TEXT')
+    _add_column(conn, 'knockout_slots', 'next_idx', 'INTEGER')
+    _add_column(conn, 'knockout_slots', 'next_slot', 'INTEGER')
+    _add_column(conn, 'tournaments', 'revision', 'INTEGER NOT NULL DEFAULT 0')
+    # denormalized summary so the index page never touches the other tables
+    _add_column(conn, 'tournaments', 'player_count', 'INTEGER')
+    _add_column(conn, 'tournaments', 'player_names', 'TEXT')
+    _add_column(conn, 'tournaments', 'status', 'TEXT')
+    _add_column(conn, 'tournaments', 'champion', 'TEXT')
+    # set while a tournament is archived as one encoded ``data`` blob
+    _add_column(conn, 'tournaments', 'data_format', 'TEXT')
+    if _add_column(conn, 'standings', 'legs', 'INTEGER NOT NULL DEFAULT 0'):
+        _backfill_legs(conn)
+    _migrate_blobs(conn)
+    _link_seeded_brackets(conn)
+    _backfill_summaries(conn)
+    _unescape_player_names(conn)
+    conn.commit()
+    _create_search_index(conn)
+    conn.commit()
+    conn.close()
+
+
+def _create_search_index(conn):
+    """Create the full-text index and fill it from existing tournaments.
+
+    Returns False when SQLite was built without FTS5."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name='tournaments_fts'"
+    ).fetchone()
+    try:
+        conn.executescript(SEARCH_SCHEMA)
+    except sqlite3.OperationalError:
+        return False
+    if exists is None:
+        conn.execute("INSERT INTO tournaments_fts (tournaments_fts) VALUES ('rebuild')")
+    return True
+
+
+def _migrate_blobs(conn):
+    """Move tournaments still stored as a single JSON ``data`` blob into the
+    normalized tables and clear the blob afterwards."""
+    rows = conn.execute(
+        'SELECT id, data FROM tournaments WHERE data IS NOT NULL AND data_format IS NULL'
+    ).fetchall()
+    for r in rows:
+        blob = serialization.loads(r['data'])
+        data = {
+            'players': blob.get('players', []),
+            'groups': [{
+                'name': 'A',
+                'players': blob.get('group_a', []),
+                'schedule': blob.get('schedule_a', []),
+                'standings': blob.get('standings_a', []),
+            }],
+            'knockout': blob.get('knockout'),
+        }
+        _insert_state(conn, r['id'], data)
+        conn.execute('UPDATE tournaments SET data=NULL WHERE id=?', (r['id'],))
+
+
+def _link_seeded_brackets(conn):
+    """Turn brackets stored with placeholder names into linked graphs."""
+    rows = conn.execute(
+        "SELECT id FROM tournaments WHERE knockout_layout = 'seeded'"
+    ).fetchall()
+    for r in rows:
+        bracket = load_knockout(conn, r['id'])
+        link_bracket(bracket)
+        save_knockout(conn, r['id'], bracket)
+
+
+def _backfill_legs(conn):
+    conn.execute(
+        """UPDATE standings SET legs = (
+            SELECT COALESCE(SUM(CASE WHEN m.p1 = standings.name THEN m.score1 ELSE m.score2 END), 0)
+            FROM matches m
+            WHERE m.tournament_id = standings.tournament_id AND m.stage = standings.grp
+              AND standings.name IN (m.p1, m.p2) AND m.score1 IS NOT NULL AND m.score2 IS NOT NULL
+        )"""
+    )
+
+
+def _backfill_summaries(conn):
+    rows = conn.execute('SELECT id FROM tournaments WHERE player_count IS NULL').fetchall()
+    for r in rows:
+        players = [
+            p['name'] for p in conn.execute(
+                'SELECT name FROM players WHERE tournament_id=? ORDER BY idx', (r['id'],)
+            )
+        ]
+        _set_players_summary(conn, r['id'], players)
+        _set_bracket_summary(conn, r['id'], load_knockout(conn, r['id']))
+
+
+def _unescape_player_names(conn):
+    """Rewrite summaries stored with ``\\u`` escapes, which the search
+    index cannot match, as plain text."""
+    rows = conn.execute(
+        "SELECT id, player_names FROM tournaments WHERE instr(player_names, '\\u') > 0"
+    ).fetchall()
+    for r in rows:
+        _set_players_summary(conn, r['id'], serialization.json_loads(r['player_names']))
+
+
+def champion(bracket):
+    """Winner of the final or ``None`` while it has not been played."""
+    final = bracket.get('final') if bracket else None
+    if not final or final.get('score1') is None or final.get('score2') is None:
+        return None
+    return final['p1'] if final['score1'] >= final['score2'] else final['p2']
+
+
+def _set_players_summary(conn, t_id, players):
+    conn.execute(
+        'UPDATE tournaments SET player_count=?, player_names=? WHERE id=?',
+        (len(players), serialization.json_dumps(players), t_id),
+    )
+
+
+def _set_bracket_summary(conn, t_id, bracket):
+    winner = champion(bracket)
+    if bracket is None:
+        status = 'group'
+    elif winner is None:
+        status = 'knockout'
+    else:
+        status = 'finished'
+    conn.execute(
+        'UPDATE tournaments SET status=?, champion=? WHERE id=?', (status, winner, t_id)
+    )
+
+
+def _insert_state(conn, t_id, data):
+    """Insert a tournament's players, groups and bracket.
+
+    ``data['groups']`` lists ``{'name', 'players', 'schedule'}`` dicts in draw
+    order, optionally with the ``standings`` reached so far."""
+    _set_players_summary(conn, t_id, data.get('players', []))
+    _set_bracket_summary(conn, t_id, data.get('knockout'))
+    conn.execute('UPDATE tournaments SET advance=? WHERE id=?', (data.get('advance'), t_id))
+    conn.executemany(
+        'INSERT INTO players (tournament_id, idx, name) VALUES (?, ?, ?)',
+        [(t_id, i, p) for i, p in enumerate(data.get('players', []))],
+    )
+    for group in data.get('groups', []):
+        # standings keep the drawn group order in ``pos``
+        known = {s['name']: s for s in group.get('standings', [])}
+        conn.executemany(
+            'INSERT INTO standings (tournament_id, grp, pos, name, points, gd, legs) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [
+                (
+                    t_id, group['name'], i, p,
+                    known.get(p, {}).get('points', 0),
+                    known.get(p, {}).get('gd', 0),
+                    known.get(p, {}).get('legs', 0),
+                )
+                for i, p in enumerate(group['players'])
+            ],
+        )
+        conn.executemany(
+            'INSERT INTO matches (tournament_id, stage, idx, round, p1, p2, score1, score2) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            _schedule_rows(t_id, group['name'], group['schedule']),
+        )
+    if data.get('knockout'):
+        save_knockout(conn, t_id, data['knockout'])
+
+
+def _schedule_rows(t_id, stage, schedule):
+    # a tournament.RoundRobinSchedule streams straight from its arrays
+    if hasattr(schedule, 'rows'):
+        return ((t_id, stage, i, r, p1, p2, None, None) for i, r, p1, p2 in schedule.rows())
+    return (
+        (t_id, stage, i, m.get('round', 1), m['p1'], m['p2'], m.get('score1'), m.get('score2'))
+        for i, m in enumerate(schedule)
+    )
+
+
+def create_tournament(conn, name, created_at, data):
+    cur = conn.execute(
+        'INSERT INTO tournaments (name, created_at) VALUES (?, ?)',
+        (name, created_at),
+    )
+    _insert_state(conn, cur.lastrowid, data)
+    index_players(conn, cur.lastrowid, data['players'])
+    return cur.lastrowid
+
+
+def list_tournaments(conn, limit, before=None, after=None):
+    """One page of the archive, newest first, using keyset pagination.
+
+    ``before``/``after`` are tournament ids bounding the page. Returns
+    ``(rows, has_newer, has_older)``."""
+    cols = 'id, name, created_at, player_count, player_names, status, champion'
+    if after is not None:
+        rows = conn.execute(
+            f'SELECT {cols} FROM tournaments WHERE id > ? ORDER BY id ASC LIMIT ?',
+            (after, limit + 1),
+        ).fetchall()
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_older = True
+    else:
+        if before is None:
+            rows = conn.execute(
+                f'SELECT {cols} FROM tournaments ORDER BY id DESC LIMIT ?', (limit + 1,)
+            ).fetchall()
+            has_newer = False
+        else:
+            rows = conn.execute(
+                f'SELECT {cols} FROM tournaments WHERE id < ? ORDER BY id DESC LIMIT ?',
+                (before, limit + 1),
+            ).fetchall()
+            has_newer = True
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+    return rows, has_newer, has_older
+
+
+def get_revision(conn, t_id):
+    """Current revision of a tournament or ``None`` if it does not exist."""
+    row = conn.execute('SELECT revision FROM tournaments WHERE id=?', (t_id,)).fetchone()
+    return row['revision'] if row else None
+
+
+def get_revisions(conn, ids):
+    """``{t_id: revision}`` for those of ``ids`` that exist."""
+    ids = list(ids)
+    placeholders = ', '.join('?' * len(ids))
+    return {
+        r['id']: r['revision'] for r in conn.execute(
+            f'SELECT id, revision FROM tournaments WHERE id IN ({placeholders})', ids
+        )
+    }
+
+
+class RevisionConflict(Exception):
+    """The tournament changed since the revision a write was based on."""
+
+
+def begin_write(conn):
+    """Start a transaction that takes the write lock up front.
+
+    A deferred transaction that reads first can fail with ``SQLITE_BUSY``
+    when it upgrades to a writer; an immediate one waits on
+    ``busy_timeout`` instead."""
+    conn.execute('BEGIN IMMEDIATE')
+
+
+def bump_revision(conn, t_id, expected=None):
+    """Mark a tournament as changed; every committed write goes through here.
+
+    With ``expected`` this is a compare-and-swap: ``RevisionConflict`` is
+    raised unless the tournament is still at that revision."""
+    if expected is None:
+        conn.execute('UPDATE tournaments SET revision=revision+1 WHERE id=?', (t_id,))
+        return
+    cur = conn.execute(
+        'UPDATE tournaments SET revision=revision+1 WHERE id=? AND revision=?',
+        (t_id, expected),
+    )
+    if cur.rowcount != 1:
+        raise RevisionConflict(t_id)
+
+
+_DATE = re.compile(r'\d{4}(?:-\d{2}(?:-\d{2})?)?')
+_WORD = re.compile(r'\w+')
+
+
+def _search_query(text):
+    """Split a search into words and date prefixes (``2025``, ``2025-06``)."""
+    words, dates = [], []
+    for part in text.split():
+        if _DATE.fullmatch(part):
+            dates.append(part)
+        else:
+            words.extend(_WORD.findall(part))
+    return words, dates
+
+
+def search_tournaments(conn, text, limit):
+    """Tournaments matching every word of ``text``, best match first.
+
+    Words match the start of words in the name, the player names or the
+    champion; date words match the start of ``created_at``. Uses the FTS5
+    index when there is one and plain ``LIKE`` scans otherwise."""
+    words, dates = _search_query(text)
+    if not words and not dates:
+        return []
+    cols = ', '.join(f't.{c}' for c in (
+        'id', 'name', 'created_at', 'player_count', 'player_names', 'status', 'champion'
+    ))
+    where, params = [], []
+    for date in dates:
+        # a range rather than LIKE, so the created_at index is used
+        where.append('t.created_at >= ? AND t.created_at < ?')
+        params.extend((date, date + '~'))
+    if not words:
+        sql = f'SELECT {cols} FROM tournaments t WHERE {" AND ".join(where)} ORDER BY t.id DESC'
+    elif conn.execute("SELECT 1 FROM sqlite_master WHERE name='tournaments_fts'").fetchone():
+        match = ' '.join('"' + w + '"*' for w in words)
+        weights = ', '.join(map(str, SEARCH_WEIGHTS))
+        sql = (
+            f'SELECT {cols} FROM tournaments_fts f JOIN tournaments t ON t.id = f.rowid '
+            f'WHERE tournaments_fts MATCH ?{"".join(" AND " + w for w in where)} '
+            f'ORDER BY bm25(tournaments_fts, {weights}), t.id DESC'
+        )
+        params.insert(0, match)
+    else:
+        for w in words:
+            # words are \w runs, so _ is the only wildcard they can hold
+            like = '%' + w.replace('_', '\\_') + '%'
+            where.append(
+                "(t.name LIKE ? ESCAPE '\\' OR t.player_names LIKE ? ESCAPE '\\' "
+                "OR t.champion LIKE ? ESCAPE '\\')"
+            )
+            params.extend((like, like, like))
+        sql = f'SELECT {cols} FROM tournaments t WHERE {" AND ".join(where)} ORDER BY t.id DESC'
+    return conn.execute(sql + ' LIMIT ?', (*params, limit)).fetchall()
+
+
+def delete_tournament(conn, t_id):
+    unindex_tournament(conn, t_id)
+    conn.execute('DELETE FROM tournaments WHERE id=?', (t_id,))
+
+
+def _match_dict(row):
+    return {'p1': row['p1'], 'p2': row['p2'], 'score1': row['score1'], 'score2': row['score2']}
+
+
+def load_tournament(conn, t_id):
+    """Return ``(name, data)`` for a tournament or ``None`` if it does not exist.
+
+    ``data`` holds ``players``, the ``groups`` in name order (each with its
+    ``players`` in draw order, ``schedule`` and ``standings``), ``advance`` and
+    the ``knockout`` bracket once there is one."""
+    row = conn.execute(
+        'SELECT name, knockout_size, knockout_layout, advance, data, data_format '
+        'FROM tournaments WHERE id=?',
+        (t_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    if row['data_format'] is not None:
+        return row['name'], serialization.loads(row['data'], row['data_format'])
+    players = [
+        r['name'] for r in conn.execute(
+            'SELECT name FROM players WHERE tournament_id=? ORDER BY idx', (t_id,)
+        )
+    ]
+    groups = {}
+    for r in conn.execute(
+        'SELECT grp, name, points, gd, legs FROM standings WHERE tournament_id=? ORDER BY grp, pos',
+        (t_id,),
+    ):
+        group = groups.setdefault(
+            r['grp'], {'name': r['grp'], 'players': [], 'schedule': [], 'standings': []}
+        )
+        group['players'].append(r['name'])
+        group['standings'].append(
+            {'name': r['name'], 'points': r['points'], 'gd': r['gd'], 'legs': r['legs']}
+        )
+    for r in conn.execute(
+        'SELECT stage, round, p1, p2, score1, score2 FROM matches '
+        'WHERE tournament_id=? ORDER BY stage, idx',
+        (t_id,),
+    ):
+        m = _match_dict(r)
+        m['round'] = r['round']
+        groups[r['stage']]['schedule'].append(m)
+    data = {
+        'players': players,
+        'groups': list(groups.values()),
+        'advance': row['advance'],
+    }
+    bracket = load_knockout(conn, t_id, row['knockout_size'], row['knockout_layout'])
+    if bracket is not None:
+        data['knockout'] = bracket
+    return row['name'], data
+
+
+def archive_tournament(conn, t_id, fmt):
+    """Fold a tournament into one ``data`` blob encoded in ``fmt``.
+
+    Its rows in the other tables are dropped; the summary columns stay, so
+    it is still listed. Reads decode the blob and the next write restores
+    the rows. Archiving an archived tournament re-encodes it."""
+    loaded = load_tournament(conn, t_id)
+    if loaded is None:
+        return False
+    conn.execute(
+        'UPDATE tournaments SET data=?, data_format=? WHERE id=?',
+        (serialization.dumps(loaded[1], fmt), fmt, t_id),
+    )
+    for table in ('knockout_slots', 'matches', 'standings', 'players'):
+        conn.execute(f'DELETE FROM {table} WHERE tournament_id=?', (t_id,))
+    return True
+
+
+def restore_tournament(conn, t_id):
+    """Move an archived tournament back into the tables.
+
+    Returns False when it was not archived."""
+    row = conn.execute(
+        'SELECT data, data_format FROM tournaments WHERE id=?', (t_id,)
+    ).fetchone()
+    if row is None or row['data_format'] is None:
+        return False
+    _insert_state(conn, t_id, serialization.loads(row['data'], row['data_format']))
+    conn.execute('UPDATE tournaments SET data=NULL, data_format=NULL WHERE id=?', (t_id,))
+    return True
+
+
+def archive_candidates(conn, fmt, recode=False):
+    """Ids of finished tournaments not yet archived, and with ``recode``
+    also those archived in a format other than ``fmt``."""
+    sql = "SELECT id FROM tournaments WHERE status = 'finished' AND (data_format IS NULL"
+    if recode:
+        sql += ' OR data_format != ?'
+    rows = conn.execute(sql + ') ORDER BY id', (fmt,) if recode else ()).fetchall()
+    return [r['id'] for r in rows]
+
+
+def append_events(conn, t_id, revision, kind, results, ref=None):
+    """Append one write's results to the event log.
+
+    ``results`` are ``(stage, index, score1, score2, prev1, prev2)`` tuples;
+    ``ref`` is the revision an ``undo`` write takes back."""
+    start = conn.execute(
+        'SELECT COALESCE(MAX(seq), 0) FROM events WHERE tournament_id=?', (t_id,)
+    ).fetchone()[0]
+    now = datetime.utcnow().isoformat(timespec='seconds')
+    conn.executemany(
+        'INSERT INTO events (tournament_id, seq, revision, kind, ref, stage, idx, '
+        'score1, score2, prev1, prev2, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [
+            (t_id, start + n, revision, kind, ref, *result, now)
+            for n, result in enumerate(results, 1)
+        ],
+    )
+
+
+def list_events(conn, t_id, after=0, limit=None):
+    """Logged results of a tournament with ``seq`` above ``after``, oldest first."""
+    sql = 'SELECT * FROM events WHERE tournament_id=? AND seq>? ORDER BY seq'
+    params = [t_id, after]
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return [dict(r) for r in conn.execute(sql, params)]
+
+
+def undo_target(conn, t_id):
+    """Revision of the latest score write that has not been undone, or ``None``."""
+    row = conn.execute(
+        "SELECT MAX(revision) FROM events WHERE tournament_id=? AND kind='score' "
+        "AND revision NOT IN (SELECT ref FROM events WHERE tournament_id=? AND kind='undo')",
+        (t_id, t_id),
+    ).fetchone()
+    return row[0]
+
+
+def snapshot_revision(conn, t_id):
+    """Revision of the latest snapshot and the number of events logged since.
+
+    Returns ``(None, 0)`` for a tournament without snapshots."""
+    row = conn.execute(
+        'SELECT MAX(revision) FROM snapshots WHERE tournament_id=?', (t_id,)
+    ).fetchone()
+    if row[0] is None:
+        return None, 0
+    count = conn.execute(
+        'SELECT COUNT(*) FROM events WHERE tournament_id=? AND revision>?', (t_id, row[0])
+    ).fetchone()[0]
+    return row[0], count
+
+
+def save_snapshot(conn, t_id, revision, data, fmt):
+    conn.execute(
+        'INSERT OR REPLACE INTO snapshots (tournament_id, revision, data_format, data) '
+        'VALUES (?, ?, ?, ?)',
+        (t_id, revision, fmt, serialization.dumps(data, fmt)),
+    )
+
+
+def load_history(conn, t_id, revision):
+    """Latest snapshot at or before ``revision`` and the events after it.
+
+    Returns ``(snapshot_revision, data, events)`` with the events up to
+    ``revision`` in log order, or ``None`` when the history does not reach
+    back that far."""
+    row = conn.execute(
+        'SELECT revision, data_format, data FROM snapshots '
+        'WHERE tournament_id=? AND revision<=? ORDER BY revision DESC LIMIT 1',
+        (t_id, revision),
+    ).fetchone()
+    if row is None:
+        return None
+    events = [
+        dict(r) for r in conn.execute(
+            'SELECT revision, stage, idx, score1, score2 FROM events '
+            'WHERE tournament_id=? AND revision>? AND revision<=? ORDER BY seq',
+            (t_id, row['revision'], revision),
+        )
+    ]
+    return row['revision'], serialization.loads(row['data'], row['data_format']), events
+
+
+def load_current(conn, t_id):
+    """``(revision, (name, data))`` read in one transaction, or ``None``.
+
+    The state is consistent with the revision it is returned with, which
+    is what writers compare against."""
+    conn.execute('BEGIN')
+    try:
+        revision = get_revision(conn, t_id)
+        if revision is None:
+            return None
+        return revision, load_tournament(conn, t_id)
+    finally:
+        conn.rollback()
+
+
+def _player_ids(conn, names):
+    """Ids in the player index for ``names``, adding players not seen before."""
+    ids = {}
+    for name in names:
+        key = ratings.normalize_name(name)
+        conn.execute(
+            'INSERT INTO player_index (key, name, rating) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO NOTHING',
+            (key, name, ratings.INITIAL_RATING),
+        )
+        ids[name] = conn.execute('SELECT id FROM player_index WHERE key=?', (key,)).fetchone()[0]
+    return ids
+
+
+def index_players(conn, t_id, names):
+    conn.executemany(
+        'INSERT OR IGNORE INTO entries (player_id, tournament_id) VALUES (?, ?)',
+        [(p_id, t_id) for p_id in _player_ids(conn, names).values()],
+    )
+
+
+def _revert_results(conn, rows):
+    conn.executemany(
+        'UPDATE player_index SET rating = rating - ?, played = played - 1 WHERE id=?',
+        [(r['rating_delta'], r['player_id']) for r in rows],
+    )
+
+
+def index_results(conn, t_id, played, played_at=None, k=ratings.K_FACTOR):
+    """Bring the indexed results of ``t_id`` in line with ``played``.
+
+    ``played`` holds ``(stage, index, p1, p2, score1, score2)`` for every
+    match a write touched; matches without both players and scores are
+    dropped from the index. A changed result first gives back the rating
+    points it moved and is then rated again against the current ratings."""
+    played_at = played_at or datetime.utcnow().isoformat(timespec='seconds')
+    for stage, idx, p1, p2, score1, score2 in played:
+        old = conn.execute(
+            'SELECT player_id, opponent_id, score_for, score_against, rating_delta FROM results '
+            'WHERE tournament_id=? AND stage=? AND idx=? ORDER BY player_id',
+            (t_id, stage, idx),
+        ).fetchall()
+        playable = p1 and p2 and score1 is not None and score2 is not None
+        ids = _player_ids(conn, (p1, p2)) if playable else {}
+        # players entered twice under one name share an id; such a match
+        # is left out of the index
+        playable = playable and ids[p1] != ids[p2]
+        new = {(ids[p1], score1, score2), (ids[p2], score2, score1)} if playable else set()
+        if {(r['player_id'], r['score_for'], r['score_against']) for r in old} == new:
+            continue
+        if old:
+            _revert_results(conn, old)
+            conn.execute(
+                'DELETE FROM results WHERE tournament_id=? AND stage=? AND idx=?',
+                (t_id, stage, idx),
+            )
+        if not playable:
+            continue
+        id1, id2 = ids[p1], ids[p2]
+        rating1, rating2 = (
+            conn.execute('SELECT rating FROM player_index WHERE id=?', (p_id,)).fetchone()[0]
+            for p_id in (id1, id2)
+        )
+        delta = ratings.elo_delta(rating1, rating2, score1, score2, k)
+        rows = [
+            (t_id, stage, idx, id1, id2, score1, score2, delta, played_at),
+            (t_id, stage, idx, id2, id1, score2, score1, -delta, played_at),
+        ]
+        conn.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        conn.executemany(
+            'UPDATE player_index SET rating = rating + ?, played = played + 1 WHERE id=?',
+            [(delta, id1), (-delta, id2)],
+        )
+
+
+def unindex_tournament(conn, t_id):
+    """Take back the rating points moved by a tournament's results."""
+    _revert_results(conn, conn.execute(
+        'SELECT player_id, rating_delta FROM results WHERE tournament_id=?', (t_id,)
+    ).fetchall())
+    conn.execute('DELETE FROM results WHERE tournament_id=?', (t_id,))
+    conn.execute('DELETE FROM entries WHERE tournament_id=?', (t_id,))
+
+
+def reset_player_index(conn):
+    """Clear all results and ratings before the index is built again."""
+    conn.execute('DELETE FROM results')
+    conn.execute('DELETE FROM entries')
+    conn.execute('UPDATE player_index SET rating=?, played=0', (ratings.INITIAL_RATING,))
+
+
+def player_ranking(conn, limit, offset=0):
+    """Rated players, highest rating first."""
+    return [dict(r) for r in conn.execute(
+        'SELECT id, name, rating, played FROM player_index WHERE played > 0 '
+        'ORDER BY rating DESC, id LIMIT ? OFFSET ?',
+        (limit, offset),
+    )]
+
+
+def player_ratings(conn, names):
+    """``{name: rating}`` for the indexed players among ``names``."""
+    keys = {ratings.normalize_name(name): name for name in names}
+    placeholders = ', '.join('?' * len(keys))
+    return {
+        keys[r['key']]: r['rating'] for r in conn.execute(
+            f'SELECT key, rating FROM player_index WHERE key IN ({placeholders})', list(keys)
+        )
+    }
+
+
+def find_player(conn, name):
+    row = conn.execute(
+        'SELECT id, name, rating, played FROM player_index WHERE key=?',
+        (ratings.normalize_name(name),),
+    ).fetchone()
+    return dict(row) if row is not None else None
+
+
+def player_tournaments(conn, player_id):
+    return [dict(r) for r in conn.execute(
+        'SELECT t.id, t.name, t.created_at, t.status, t.champion FROM entries e '
+        'JOIN tournaments t ON t.id = e.tournament_id WHERE e.player_id=? ORDER BY t.id DESC',
+        (player_id,),
+    )]
+
+
+def player_results(conn, player_id, limit=None):
+    """A player's indexed matches, latest first."""
+    sql = (
+        'SELECT r.tournament_id, r.stage, r.idx, o.name AS opponent, r.score_for, '
+        'r.score_against, r.rating_delta, r.played_at FROM results r '
+        'JOIN player_index o ON o.id = r.opponent_id WHERE r.player_id=? '
+        'ORDER BY r.played_at DESC, r.tournament_id DESC, r.stage, r.idx'
+    )
+    params = [player_id]
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return [dict(r) for r in conn.execute(sql, params)]
+
+
+def load_standings(conn, t_id, group, names=None):
+    """Standings of ``group`` in draw order, optionally only for ``names``."""
+    sql = 'SELECT name, points, gd, legs FROM standings WHERE tournament_id=? AND grp=?'
+    params = [t_id, group]
+    if names is not None:
+        sql += f" AND name IN ({','.join('?' * len(names))})"
+        params.extend(names)
+    rows = conn.execute(sql + ' ORDER BY pos', params).fetchall()
+    return [
+        {'name': r['name'], 'points': r['points'], 'gd': r['gd'], 'legs': r['legs']}
+        for r in rows
+    ]
+
+
+def save_standing(conn, t_id, group, standing):
+    """Write back one ``tournament.Standing``."""
+    conn.execute(
+        'UPDATE standings SET points=?, gd=?, legs=? WHERE tournament_id=? AND grp=? AND name=?',
+        (standing.points, standing.gd, standing.legs, t_id, group, standing.name),
+    )
+
+
+def load_match(conn, t_id, stage, idx):
+    row = conn.execute(
+        'SELECT round, p1, p2, score1, score2 FROM matches '
+        'WHERE tournament_id=? AND stage=? AND idx=?',
+        (t_id, stage, idx),
+    ).fetchone()
+    if row is None:
+        return None
+    m = _match_dict(row)
+    m['round'] = row['round']
+    return m
+
+
+def save_match(conn, t_id, stage, idx, match):
+    conn.execute(
+        'UPDATE matches SET score1=?, score2=? WHERE tournament_id=? AND stage=? AND idx=?',
+        (match['score1'], match['score2'], t_id, stage, idx),
+    )
+
+
+def load_knockout(conn, t_id, size=None, layout=None):
+    """Rebuild the bracket dict from ``knockout_slots`` or return ``None``."""
+    if size is None:
+        row = conn.execute(
+            'SELECT knockout_size, knockout_layout FROM tournaments WHERE id=?', (t_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        size, layout = row['knockout_size'], row['knockout_layout']
+    if size is None:
+        return None
+    seeds = [
+        r['name'] for r in conn.execute(
+            'SELECT name FROM players WHERE tournament_id=? AND seed IS NOT NULL ORDER BY seed',
+            (t_id,),
+        )
+    ]
+    bracket = {'size': size, 'seeds': seeds}
+    if layout is not None:
+        bracket['layout'] = layout
+    stages = set()
+    for r in conn.execute(
+        'SELECT stage, idx, p1, p2, score1, score2, next_stage, next_idx, next_slot '
+        'FROM knockout_slots WHERE tournament_id=? ORDER BY stage, idx',
+        (t_id,),
+    ):
+        stages.add(r['stage'])
+        if r['stage'] == 'final':
+            bracket['final'] = _slot_dict(r)
+        else:
+            bracket.setdefault(r['stage'], []).append(_slot_dict(r))
+    bracket['stages'] = sorted(stages, key=stage_rank)
+    return bracket
+
+
+def _slot_dict(row):
+    m = _match_dict(row)
+    m['next'] = None
+    if row['next_stage'] is not None:
+        m['next'] = [row['next_stage'], row['next_idx'], row['next_slot']]
+    return m
+
+
+def _slot_row(t_id, stage, idx, m):
+    nxt = m.get('next') or (None, None, None)
+    return (t_id, stage, idx, m.get('p1'), m.get('p2'), m.get('score1'), m.get('score2'), *nxt)
+
+
+_SAVE_SLOT = (
+    'INSERT OR REPLACE INTO knockout_slots '
+    '(tournament_id, stage, idx, p1, p2, score1, score2, next_stage, next_idx, next_slot) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+
+
+def _knockout_slots(bracket):
+    for stage in bracket.get('stages', KNOCKOUT_STAGES):
+        if stage == 'final':
+            if 'final' in bracket:
+                yield stage, 0, bracket['final']
+            continue
+        for i, m in enumerate(bracket.get(stage, [])):
+            yield stage, i, m
+
+
+def save_knockout(conn, t_id, bracket, previous=None):
+    """Persist ``bracket`` and return the number of slots written.
+
+    When ``previous`` (the bracket as it was loaded) is given only the slots
+    that differ from it are written, so an unchanged bracket costs nothing."""
+    if previous is None:
+        conn.execute(
+            'UPDATE tournaments SET knockout_size=?, knockout_layout=? WHERE id=?',
+            (bracket['size'], bracket.get('layout'), t_id),
+        )
+        conn.execute('UPDATE players SET seed=NULL WHERE tournament_id=?', (t_id,))
+        conn.executemany(
+            'UPDATE players SET seed=? WHERE tournament_id=? AND name=?',
+            [(i, t_id, name) for i, name in enumerate(bracket['seeds'])],
+        )
+        conn.execute('DELETE FROM knockout_slots WHERE tournament_id=?', (t_id,))
+        old = {}
+    else:
+        old = {(stage, i): m for stage, i, m in _knockout_slots(previous)}
+    dirty = [
+        _slot_row(t_id, stage, i, m)
+        for stage, i, m in _knockout_slots(bracket)
+        if old.get((stage, i)) != m
+    ]
+    conn.executemany(_SAVE_SLOT, dirty)
+    if dirty:
+        _set_bracket_summary(conn, t_id, bracket)
+    return len(dirty)
+
+
+def save_slots(conn, t_id, bracket, slots):
+    """Write only the ``(stage, index)`` slots of ``bracket`` listed in ``slots``."""
+    conn.executemany(
+        _SAVE_SLOT,
+        [
+            _slot_row(t_id, stage, i, bracket['final'] if stage == 'final' else bracket[stage][i])
+            for stage, i in slots
+        ],
+    )
+    if ('final', 0) in slots:
+        _set_bracket_summary(conn, t_id, bracket)
+
+
+def load_session(conn, sid, now):
+    """``(data, expires)`` of a live session or ``None``."""
+    row = conn.execute(
+        'SELECT data, expires FROM sessions WHERE id=? AND expires>?', (sid, now)
+    ).fetchone()
+    return (row['data'], row['expires']) if row is not None else None
+
+
+def save_session(conn, sid, data, expires):
+    conn.execute(
+        'INSERT INTO sessions (id, data, expires) VALUES (?, ?, ?) '
+        'ON CONFLICT (id) DO UPDATE SET data=excluded.data, expires=excluded.expires',
+        (sid, data, expires),
+    )
+
+
+def delete_session(conn, sid):
+    conn.execute('DELETE FROM sessions WHERE id=?', (sid,))
+
+
+def sweep_sessions(conn, now):
+    """Delete expired sessions; returns how many."""
+    return conn.execute('DELETE FROM sessions WHERE expires<=?', (now,)).rowcount
+
+
+def shared_setting(conn, key, default):
+    """The stored value of ``key``, storing ``default()`` if there is none.
+
+    Every process using the database ends up with the same value."""
+    conn.execute(
+        'INSERT INTO settings (key, value) VALUES (?, ?) ON CONFLICT (key) DO NOTHING',
+        (key, default()),
+    )
+    return conn.execute('SELECT value FROM settings WHERE key=?', (key,)).fetchone()[0]
@@ -0,0 +1,81 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Only histograms are needed here: each one keeps cumulative bucket counts,
+a sum and a count per label set, which is also what Prometheus derives
+rates and averages from. Everything lives in one process, like the caches
+and the event broker.
+"""
+import bisect
+import threading
+
+# seconds; request latencies and single queries both fall in this range
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (not cumulative), +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            if i < len(self.buckets):
+                series[0][i] += 1
+            else:
+                series[1] += 1
+            series[2] += value
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in sorted(self._series.items())]
+        for values, counts, over, total in series:
+            labels = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts + [over]):
+                cumulative += count
+                le = ','.join(labels + [f'le="{_format(bound)}"'])
+                lines.append(f"{self.name}_bucket{{{le}}} {cumulative}")
+            suffix = '{' + ','.join(labels) + '}' if labels else ''
+            lines.append(f"{self.name}_sum{suffix} {_format(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, help, labels, buckets)
+        return self._metrics[name]
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
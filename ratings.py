@@ -0,0 +1,26 @@
+"""Elo ratings across tournaments.
+
+Every match moves rating points from the loser to the winner: ``k`` times
+the difference between the result (1 for a win, 0.5 for a draw) and the
+result expected from the two ratings. The points moved are stored with the
+match, so a corrected or cleared result can be taken back exactly.
+"""
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+
+
+def normalize_name(name: str) -> str:
+    """The key players are matched on across tournaments."""
+    return ' '.join(name.split()).casefold()
+
+
+def expected_score(rating: float, opponent: float) -> float:
+    return 1.0 / (1.0 + 10.0 ** ((opponent - rating) / 400.0))
+
+
+def elo_delta(rating1: float, rating2: float, score1: int, score2: int,
+              k: float = K_FACTOR) -> float:
+    """Rating points player 1 gains (player 2 loses the same) for a result."""
+    actual = 1.0 if score1 > score2 else 0.0 if score1 < score2 else 0.5
+    return k * (actual - expected_score(rating1, rating2))
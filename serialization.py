@@ -0,0 +1,108 @@
+"""Encoding of tournament state for storage and transport.
+
+A storage format is a codec optionally followed by a compression, for
+example ``json``, ``json+zlib`` or ``msgpack+zstd``. The format is stored
+next to every encoded blob, so rows written with one format stay readable
+after the default changes.
+
+``orjson``, ``msgpack`` and ``zstandard`` are optional. JSON is always
+encoded and decoded with orjson when it is installed; its output is plain
+JSON, so it is recorded simply as ``json``.
+"""
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def json_dumps(obj) -> str:
+    """Compact JSON text; non-ASCII characters are kept as they are, as
+    orjson does, so stored text stays searchable."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def json_loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _json_encode(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+CODECS = {'json': (_json_encode, json_loads)}
+if msgpack is not None:
+    CODECS['msgpack'] = (
+        lambda obj: msgpack.packb(obj, use_bin_type=True),
+        lambda blob: msgpack.unpackb(blob, raw=False),
+    )
+
+COMPRESSIONS = {
+    'zlib': (lambda b: zlib.compress(b, ZLIB_LEVEL), zlib.decompress),
+}
+if zstandard is not None:
+    # compressor objects are not safe to share between threads
+    COMPRESSIONS['zstd'] = (
+        lambda b: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(b),
+        lambda b: zstandard.ZstdDecompressor().decompress(b),
+    )
+
+
+def _parse(fmt):
+    codec, _, compression = (fmt or 'json').partition('+')
+    if codec not in CODECS or (compression and compression not in COMPRESSIONS):
+        raise ValueError(f"unknown or unavailable format {fmt!r}")
+    return codec, compression
+
+
+def check_format(fmt):
+    """Raise ``ValueError`` unless ``fmt`` can be written here."""
+    _parse(fmt)
+    return fmt
+
+
+def best_format(compress=True):
+    """The most compact format the installed libraries support."""
+    codec = 'msgpack' if 'msgpack' in CODECS else 'json'
+    if not compress:
+        return codec
+    return f"{codec}+{'zstd' if 'zstd' in COMPRESSIONS else 'zlib'}"
+
+
+def dumps(obj, fmt='json') -> bytes:
+    codec, compression = _parse(fmt)
+    blob = CODECS[codec][0](obj)
+    if compression:
+        blob = COMPRESSIONS[compression][0](blob)
+    return blob
+
+
+def loads(blob, fmt='json'):
+    """Decode ``blob`` stored in ``fmt``; ``None`` means legacy JSON text."""
+    codec, compression = _parse(fmt)
+    if isinstance(blob, str):
+        blob = blob.encode()
+    if compression:
+        blob = COMPRESSIONS[compression][1](blob)
+    return CODECS[codec][1](blob)
@@ -0,0 +1,204 @@
+"""Server-side sessions, so any worker process can serve any request.
+
+The session cookie only carries a signed random id; the session itself is
+kept in the SQLite database (the default) or in Redis. Which one is used is
+set by ``SESSION_BACKEND``: ``sqlite``, ``redis`` (``SESSION_REDIS_URL``) or
+``cookie`` for Flask's own signed cookie sessions.
+
+Sessions that are not permanent are dropped after ``SESSION_IDLE_LIFETIME``
+without a request, permanent ones after ``PERMANENT_SESSION_LIFETIME``.
+Redis expires keys itself; expired SQLite rows are swept every
+``SESSION_SWEEP_INTERVAL`` seconds by whichever worker gets there first,
+or by ``flask sweep-sessions``.
+"""
+import secrets
+import threading
+import time
+from datetime import timedelta
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+import db
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, blob=None, expires=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        # the stored form and expiry, to skip writes that change nothing
+        self.blob = blob
+        self.expires = expires
+        # who the session belonged to when it was opened
+        self.user_id = self.get('_user_id')
+        self.modified = False
+
+
+class SQLiteSessionStore:
+    """Sessions in the ``sessions`` table, on connections of their own.
+
+    A pooled connection outside the request's keeps session writes out of
+    whatever transaction a view left open."""
+
+    def __init__(self, sweep_interval=3600):
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _run(self, func, *args, commit=False):
+        pool = db.get_pool()
+        conn = pool.acquire()
+        try:
+            result = func(conn, *args)
+            if commit:
+                conn.commit()
+            return result
+        finally:
+            pool.release(conn)
+
+    def get(self, sid):
+        return self._run(db.load_session, sid, time.time())
+
+    def set(self, sid, blob, expires):
+        self._run(db.save_session, sid, blob, expires, commit=True)
+        self.maybe_sweep()
+
+    def delete(self, sid):
+        self._run(db.delete_session, sid, commit=True)
+
+    def sweep(self):
+        return self._run(db.sweep_sessions, time.time(), commit=True)
+
+    def maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        self.sweep()
+
+
+class RedisSessionStore:
+    """Sessions as Redis keys that expire on their own."""
+
+    def __init__(self, url, prefix='session:'):
+        if redis is None:
+            raise RuntimeError("SESSION_BACKEND 'redis' needs the redis package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        with self.client.pipeline() as pipe:
+            blob, ttl = pipe.get(self.prefix + sid).pttl(self.prefix + sid).execute()
+        if blob is None:
+            return None
+        return blob, time.time() + max(ttl, 0) / 1000
+
+    def set(self, sid, blob, expires):
+        ttl = max(int((expires - time.time()) * 1000), 1)
+        self.client.set(self.prefix + sid, blob, px=ttl)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+    def sweep(self):
+        return 0
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    def __init__(self, store, idle_lifetime):
+        self.store = store
+        self.idle_lifetime = idle_lifetime
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='session-id')
+
+    def _lifetime(self, app, session):
+        if session.permanent:
+            return app.permanent_session_lifetime.total_seconds()
+        return self.idle_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            found = self.store.get(sid) if sid else None
+            if found is not None:
+                blob, expires = found
+                blob = blob.decode() if isinstance(blob, bytes) else blob
+                return ServerSession(self.serializer.loads(blob), sid, blob, expires)
+        return ServerSession(sid=secrets.token_urlsafe(32))
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.get('_user_id') != session.user_id and session.blob is not None:
+            # a new id on login and logout, so an id handed out before
+            # cannot be planted on someone who then logs in
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.blob = None
+            if not session:
+                response.delete_cookie(name, domain=domain, path=path)
+                return
+        if not session:
+            if session.blob is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        response.vary.add('Cookie')
+        blob = self.serializer.dumps(dict(session))
+        lifetime = self._lifetime(app, session)
+        now = time.time()
+        # rewrite an unchanged session only once half its lifetime is used up
+        if blob == session.blob and session.expires - now > lifetime / 2:
+            return
+        self.store.set(session.sid, blob, now + lifetime)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_app(app):
+    """Install the configured session backend."""
+    app.config.setdefault('SESSION_BACKEND', 'sqlite')
+    app.config.setdefault('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+    app.config.setdefault('SESSION_IDLE_LIFETIME', timedelta(days=1))
+    app.config.setdefault('SESSION_SWEEP_INTERVAL', 3600)
+    idle = app.config['SESSION_IDLE_LIFETIME']
+    if not isinstance(idle, timedelta):
+        idle = timedelta(seconds=idle)
+    backend = app.config['SESSION_BACKEND']
+    if backend == 'cookie':
+        return
+    if backend == 'sqlite':
+        store = SQLiteSessionStore(app.config['SESSION_SWEEP_INTERVAL'])
+    elif backend == 'redis':
+        store = RedisSessionStore(app.config['SESSION_REDIS_URL'])
+    else:
+        raise ValueError(f"unknown SESSION_BACKEND {backend!r}")
+    app.session_interface = ServerSessionInterface(store, idle)
@@ -0,0 +1,312 @@
+"""Monte Carlo estimates of how a tournament can still end.
+
+The remaining group matches are played out many times, the knockout is
+seeded from each simulated set of group tables and then played out as well.
+The counts give every player's chance to qualify, to get each seed and to
+win the title.
+
+Each match is decided by the players' Elo ratings (see ``ratings``). Its
+scoreline is drawn from the scorelines already played in the tournament,
+so draws only happen where the format has produced them. Results already
+recorded are kept as they are.
+
+NumPy is optional. With it, runs are simulated in batches of arrays and
+groups are ranked with the same tiebreaks as ``StandingsTable``, the
+head-to-head mini-table included. Without NumPy a slower pure-Python loop
+plays each run through ``StandingsTable`` itself, so it should be given far
+fewer runs.
+"""
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from ratings import INITIAL_RATING, expected_score
+from tournament import (
+    StandingsTable,
+    bracket_layout,
+    bracket_matches,
+    knockout_qualifiers,
+    knockout_seeds,
+    match_winner,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# scorelines assumed before any match has been played: (winner, loser) legs
+DEFAULT_SCORELINES = ((3, 0), (3, 1), (3, 2))
+
+# runs simulated per batch of arrays; bounds memory for large fields
+BATCH = 25_000
+
+
+@dataclass
+class _Group:
+    name: str
+    # players in draw order, the last tiebreak; ``remaining`` indexes them
+    players: List[str]
+    ids: List[int]
+    standings: List[dict]
+    played: List[dict]
+    # (local index of p1, local index of p2) of unplayed matches
+    remaining: List[Tuple[int, int]]
+    # the table of the played matches, copied by each pure-Python run
+    table: Optional[StandingsTable] = None
+
+
+@dataclass
+class _Field:
+    names: List[str]
+    ratings: List[float]
+    groups: List[_Group]
+    # players per group that go through, None for the one-group rules
+    advance: Optional[int]
+    qualifiers: int
+    scorelines: List[Tuple[int, int]]
+    # set once the bracket is stored: seed ids and decided match winners
+    seeds: Optional[List[int]] = None
+    decided: Dict[Tuple[str, int], int] = field(default_factory=dict)
+    # brackets from before the graph layout are not played out
+    playable: bool = True
+
+
+def _prepare(data, player_ratings):
+    names, groups, scorelines = [], [], set()
+    for group in data['groups']:
+        ids = list(range(len(names), len(names) + len(group['players'])))
+        names.extend(group['players'])
+        local = {name: i for i, name in enumerate(group['players'])}
+        played, remaining = [], []
+        for m in group['schedule']:
+            if m['score1'] is None or m['score2'] is None:
+                remaining.append((local[m['p1']], local[m['p2']]))
+            else:
+                played.append(m)
+                scorelines.add((max(m['score1'], m['score2']), min(m['score1'], m['score2'])))
+        groups.append(_Group(
+            group['name'], group['players'], ids, group['standings'], played, remaining
+        ))
+
+    advance = data.get('advance')
+    if len(groups) == 1 and advance is None:
+        qualifiers = knockout_qualifiers(len(names))
+    else:
+        per_group = 2 if advance is None else max(advance, 0)
+        qualifiers = sum(min(per_group, len(g.ids)) for g in groups)
+    sim = _Field(
+        names=names,
+        ratings=[player_ratings.get(n, INITIAL_RATING) for n in names],
+        groups=groups,
+        advance=advance,
+        qualifiers=qualifiers,
+        scorelines=sorted(scorelines) or list(DEFAULT_SCORELINES),
+    )
+
+    bracket = data.get('knockout')
+    if bracket is not None:
+        # the stored bracket fixes the seeds and every result played in it
+        ids = {name: i for i, name in enumerate(names)}
+        sim.qualifiers = bracket['size']
+        sim.playable = bracket.get('layout') == 'graph'
+        sim.seeds = [ids[name] for name in bracket['seeds']]
+        for stage in bracket['stages']:
+            for j, m in enumerate(bracket_matches(bracket, stage)):
+                winner = match_winner(m)
+                if winner is not None:
+                    sim.decided[stage, j] = ids[winner]
+    return sim
+
+
+def simulate(data, player_ratings=None, runs=100_000, seed=None):
+    """Play out the rest of a tournament ``runs`` times.
+
+    ``data`` is the decoded state (groups with ``players``, ``schedule`` and
+    ``standings``, ``advance`` and the stored ``knockout``, if any);
+    ``player_ratings`` maps names to Elo ratings. Returns the
+    share of runs each player qualified, got each seed (best first) and won
+    the title, in group order."""
+    sim = _prepare(data, player_ratings or {})
+    layout = bracket_layout(sim.qualifiers) if sim.playable else []
+    if np is not None:
+        counts = _run_numpy(sim, layout, runs, np.random.default_rng(seed))
+        engine = 'numpy'
+    else:
+        counts = _run_python(sim, layout, runs, random.Random(seed))
+        engine = 'python'
+    qualify, seeds, titles = counts
+    players = []
+    for group in sim.groups:
+        for i in group.ids:
+            players.append({
+                'name': sim.names[i],
+                'group': group.name,
+                'qualify': round(qualify[i] / runs, 4),
+                'seeds': [round(c / runs, 4) for c in seeds[i]],
+                'title': round(titles[i] / runs, 4) if layout else None,
+            })
+    return {'runs': runs, 'engine': engine, 'players': players}
+
+
+def _run_numpy(sim, layout, runs, rng):
+    n, q = len(sim.names), sim.qualifiers
+    rating = np.array(sim.ratings)
+    scorelines = np.array(sim.scorelines)
+    qualify = np.zeros(n, dtype=np.int64)
+    seeds = np.zeros((n, q), dtype=np.int64)
+    titles = np.zeros(n, dtype=np.int64)
+    for start in range(0, runs, BATCH):
+        size = min(BATCH, runs - start)
+        if sim.seeds is not None:
+            seeded = np.broadcast_to(np.array(sim.seeds, dtype=np.int64), (size, q))
+        else:
+            tables = [_play_group(g, scorelines, rating, size, rng) for g in sim.groups]
+            seeded = _seed(tables, sim.advance, q)
+        if not q:
+            continue
+        qualify += np.bincount(seeded.ravel(), minlength=n)
+        seeds += np.stack([np.bincount(seeded[:, k], minlength=n) for k in range(q)], axis=1)
+        if layout:
+            champions = _play_knockout(seeded, layout, sim.decided, rating, rng)
+            titles += np.bincount(champions, minlength=n)
+    return qualify.tolist(), seeds.tolist(), titles.tolist()
+
+
+def _play_group(group, scorelines, rating, runs, rng):
+    """Simulated final tables: ``(ids, points, gd, legs)``, each (runs, n), best first.
+
+    Players level on points, leg difference and legs are split like
+    ``StandingsTable.ranked`` does: on points, then leg difference in the
+    matches between them, then draw order."""
+    n = len(group.ids)
+    ids = np.array(group.ids)
+    # a finished group ends the same way in every run
+    size = runs if group.remaining else 1
+    by_name = {s['name']: s for s in group.standings}
+    base = np.array([
+        [by_name[name].get(k, 0) for k in ('points', 'gd', 'legs')] for name in group.players
+    ], dtype=np.float64).reshape(n, 3)
+    points, gd, legs = (np.tile(base[:, k], (size, 1)) for k in range(3))
+    local = {name: i for i, name in enumerate(group.players)}
+    pairs = [(local[m['p1']], local[m['p2']]) for m in group.played] + group.remaining
+    if pairs:
+        first, second = np.array(pairs).reshape(-1, 2).T
+        m, k = len(first), len(group.played)
+        home = np.zeros((m, n))
+        home[np.arange(m), first] = 1
+        away = np.zeros((m, n))
+        away[np.arange(m), second] = 1
+        s1 = np.empty((size, m))
+        s2 = np.empty((size, m))
+        s1[:, :k] = [x['score1'] for x in group.played]
+        s2[:, :k] = [x['score2'] for x in group.played]
+        if group.remaining:
+            win = 1.0 / (1.0 + 10.0 ** ((rating[ids[second[k:]]] - rating[ids[first[k:]]]) / 400.0))
+            pick = scorelines[rng.integers(len(scorelines), size=(size, m - k))]
+            p1_wins = rng.random((size, m - k)) < win
+            s1[:, k:] = np.where(p1_wins, pick[..., 0], pick[..., 1])
+            s2[:, k:] = np.where(p1_wins, pick[..., 1], pick[..., 0])
+            # the stored standings already hold the played matches
+            x1, x2, home_new, away_new = s1[:, k:], s2[:, k:], home[k:], away[k:]
+            points += _result_points(x1, x2) @ home_new + _result_points(x2, x1) @ away_new
+            gd += (x1 - x2) @ home_new + (x2 - x1) @ away_new
+            legs += x1 @ home_new + x2 @ away_new
+    draw = np.broadcast_to(np.arange(n), (size, n))
+    order = np.lexsort((draw, -legs, -gd, -points), axis=1)
+    ranked = [np.take_along_axis(a, order, axis=1) for a in (points, gd, legs)]
+    tied = np.flatnonzero(np.logical_and.reduce([a[:, 1:] == a[:, :-1] for a in ranked]).any(axis=1))
+    if len(tied) and pairs:
+        # runs with level players: rank those again with the head-to-head
+        # mini-table, which only counts matches between level players
+        p, g, l, x1, x2 = points[tied], gd[tied], legs[tied], s1[tied], s2[tied]
+        level = (
+            (p[:, first] == p[:, second]) & (g[:, first] == g[:, second]) & (l[:, first] == l[:, second])
+        )
+        mini_points = (_result_points(x1, x2) * level) @ home + (_result_points(x2, x1) * level) @ away
+        mini_diff = ((x1 - x2) * level) @ home + ((x2 - x1) * level) @ away
+        order[tied] = np.lexsort((draw[tied], -mini_diff, -mini_points, -l, -g, -p), axis=1)
+    table = (ids[order], *(np.take_along_axis(a, order, axis=1) for a in (points, gd, legs)))
+    return tuple(np.broadcast_to(a, (runs, n)) for a in table)
+
+
+def _result_points(won, lost):
+    return np.where(won > lost, 3.0, np.where(won == lost, 1.0, 0.0))
+
+
+def _seed(tables, advance, qualifiers):
+    """Seed ids (runs, qualifiers) from simulated group tables, best first."""
+    if len(tables) == 1 and advance is None:
+        return tables[0][0][:, :qualifiers]
+    tiers = [np.empty((tables[0][0].shape[0], 0), dtype=np.int64)]
+    for place in range(2 if advance is None else advance):
+        tier = [t for t in tables if place < t[0].shape[1]]
+        if not tier:
+            break
+        ids, points, gd, legs = (np.stack([t[k][:, place] for t in tier], axis=1) for k in range(4))
+        groups = np.broadcast_to(np.arange(len(tier)), ids.shape)
+        order = np.lexsort((groups, -legs, -gd, -points), axis=1)
+        tiers.append(np.take_along_axis(ids, order, axis=1))
+    return np.concatenate(tiers, axis=1)
+
+
+def _play_knockout(seeded, layout, decided, rating, rng):
+    """Champion ids (runs,) of a knockout played from ``seeded``."""
+    runs = seeded.shape[0]
+    winners = {}
+    for stage, pairs in layout:
+        for j, sides in enumerate(pairs):
+            if (stage, j) in decided:
+                winners[stage, j] = np.full(runs, decided[stage, j])
+                continue
+            a, b = (seeded[:, s - 1] if isinstance(s, int) else winners[s] for s in sides)
+            win = 1.0 / (1.0 + 10.0 ** ((rating[b] - rating[a]) / 400.0))
+            winners[stage, j] = np.where(rng.random(runs) < win, a, b)
+    return winners[layout[-1][0], 0]
+
+
+def _run_python(sim, layout, runs, rng):
+    n, q = len(sim.names), sim.qualifiers
+    ids = {name: i for i, name in enumerate(sim.names)}
+    qualify = [0] * n
+    seeds = [[0] * q for _ in range(n)]
+    titles = [0] * n
+    for _ in range(runs):
+        if sim.seeds is not None:
+            seeded = sim.seeds
+        else:
+            rankings = [_play_group_once(sim, g, rng) for g in sim.groups]
+            seeded = [ids[name] for name in knockout_seeds(rankings, sim.advance)]
+        for k, i in enumerate(seeded):
+            qualify[i] += 1
+            seeds[i][k] += 1
+        if layout:
+            titles[_play_knockout_once(seeded, layout, sim, rng)] += 1
+    return qualify, seeds, titles
+
+
+def _play_group_once(sim, group, rng):
+    players = group.players
+    if group.table is None:
+        group.table = StandingsTable.from_matches(players, group.played, group.standings)
+    table = group.table.copy()
+    for a, b in group.remaining:
+        won, lost = rng.choice(sim.scorelines)
+        if rng.random() < expected_score(sim.ratings[group.ids[a]], sim.ratings[group.ids[b]]):
+            table.apply(players[a], players[b], won, lost)
+        else:
+            table.apply(players[a], players[b], lost, won)
+    return table.ranked()
+
+
+def _play_knockout_once(seeded, layout, sim, rng):
+    winners = {}
+    for stage, pairs in layout:
+        for j, sides in enumerate(pairs):
+            if (stage, j) in sim.decided:
+                winners[stage, j] = sim.decided[stage, j]
+                continue
+            a, b = (seeded[s - 1] if isinstance(s, int) else winners[s] for s in sides)
+            win = expected_score(sim.ratings[a], sim.ratings[b])
+            winners[stage, j] = a if rng.random() < win else b
+    return winners[layout[-1][0], 0]
@@ -0,0 +1,121 @@
+// Live score updates pushed by the server over Server-Sent Events
+
+document.addEventListener('DOMContentLoaded', () => {
+  const body = document.body;
+  if (!body.dataset.events || !window.EventSource) {
+    return;
+  }
+  const page = body.dataset.page;
+  let revision = Number(body.dataset.revision);
+
+  function setScore(row, m) {
+    const text = row.querySelector('.match-score');
+    if (text) {
+      text.textContent = `${m.score1 ?? ''} - ${m.score2 ?? ''}`;
+    }
+    if (!row.contains(document.activeElement)) {
+      const inputs = row.querySelectorAll('.score-input');
+      if (inputs.length === 2) {
+        inputs[0].value = m.score1 ?? '';
+        inputs[1].value = m.score2 ?? '';
+      }
+    }
+  }
+
+  // Returns false when the page has to be reloaded to show the change.
+  function setPlayers(row, m) {
+    for (const slot of ['p1', 'p2']) {
+      const cell = row.querySelector(`.match-${slot}`);
+      if (!cell || !m[slot] || cell.textContent === m[slot]) {
+        continue;
+      }
+      if (document.querySelector('form .score-input') && !row.querySelector('form')) {
+        return false;
+      }
+      cell.textContent = m[slot];
+    }
+    return true;
+  }
+
+  function setStandings(group, rows) {
+    const table = document.querySelector(`[data-standings="${CSS.escape(group)}"]`);
+    if (!table) {
+      return;
+    }
+    const header = table.querySelector('tr');
+    table.replaceChildren(header);
+    for (const s of rows) {
+      const tr = document.createElement('tr');
+      for (const value of [s.name, s.points, s.gd, s.legs]) {
+        const td = document.createElement('td');
+        td.textContent = value;
+        tr.appendChild(td);
+      }
+      // filled in by odds.js
+      for (let i = 0; i < header.querySelectorAll('.odds').length; i++) {
+        const td = document.createElement('td');
+        td.className = 'odds';
+        tr.appendChild(td);
+      }
+      table.appendChild(tr);
+    }
+  }
+
+  function apply(delta) {
+    // the board plan is worked out again from the new results
+    if (page === 'boards') {
+      return false;
+    }
+    if (page === 'knockout' && Object.keys(delta.standings).length) {
+      return false;
+    }
+    for (const m of delta.matches) {
+      const row = document.querySelector(`[data-match="${CSS.escape(`${m.stage}/${m.index}`)}"]`);
+      if (!row) {
+        if (page === 'knockout') {
+          return false;
+        }
+        continue;
+      }
+      if (!setPlayers(row, m)) {
+        return false;
+      }
+      setScore(row, m);
+    }
+    for (const [group, rows] of Object.entries(delta.standings)) {
+      setStandings(group, rows);
+    }
+    if ('champion' in delta) {
+      const line = document.querySelector('.champion-line strong');
+      if (!line) {
+        return !delta.champion;
+      }
+      if (!delta.champion) {
+        return false;
+      }
+      line.textContent = `Champion: ${delta.champion}`;
+    }
+    return true;
+  }
+
+  const source = new EventSource(body.dataset.events);
+
+  // Sent on every (re)connect: anything missed since the page was rendered
+  // means the page is stale.
+  source.addEventListener('revision', (e) => {
+    if (JSON.parse(e.data).revision !== revision) {
+      window.location.reload();
+    }
+  });
+
+  source.addEventListener('score', (e) => {
+    const delta = JSON.parse(e.data);
+    if (delta.revision !== revision + 1 || !apply(delta)) {
+      source.close();
+      window.location.reload();
+      return;
+    }
+    revision = delta.revision;
+    document.dispatchEvent(new CustomEvent('tournament:updated', { detail: delta }));
+  });
+});
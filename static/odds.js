@@ -0,0 +1,47 @@
+// Qualification and title chances from the simulation behind /api/tournament/<id>/odds
+
+document.addEventListener('DOMContentLoaded', () => {
+  const url = document.body.dataset.odds;
+  if (!url || !window.fetch) {
+    return;
+  }
+
+  function percent(p) {
+    if (p === null) {
+      return '';
+    }
+    if (p > 0 && p < 0.005) {
+      return '<1%';
+    }
+    if (p < 1 && p > 0.995) {
+      return '>99%';
+    }
+    return `${Math.round(p * 100)}%`;
+  }
+
+  async function load() {
+    const response = await fetch(url);
+    if (!response.ok) {
+      return;
+    }
+    const odds = await response.json();
+    for (const p of odds.players) {
+      const table = document.querySelector(`[data-standings="${CSS.escape(p.group)}"]`);
+      if (!table) {
+        continue;
+      }
+      for (const row of table.rows) {
+        if (row.cells[0].textContent === p.name) {
+          const cells = row.querySelectorAll('td.odds');
+          if (cells.length === 2) {
+            cells[0].textContent = percent(p.qualify);
+            cells[1].textContent = percent(p.title);
+          }
+        }
+      }
+    }
+  }
+
+  load();
+  document.addEventListener('tournament:updated', load);
+});
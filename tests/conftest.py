@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def web(tmp_path_factory):
+    """The ``app`` module, on a database of its own for the whole run."""
+    db.DB_PATH = str(tmp_path_factory.mktemp('db') / 'tournaments.db')
+    import app as web
+    web.app.config['TESTING'] = True
+    return web
+
+
+@pytest.fixture
+def admin(web):
+    client = web.app.test_client()
+    client.post('/login', data={'username': web.ADMIN_USERNAME, 'password': web.ADMIN_PASSWORD})
+    return client
+
+
+@pytest.fixture
+def start(admin):
+    """Start a tournament as the admin and return its id."""
+    def start(players, groups=1, title='Test Cup'):
+        admin.post('/start', data={
+            'players_json': json.dumps(players), 'groups': groups, 'title': title,
+        })
+        with admin.session_transaction() as session:
+            return session['current_tournament_id']
+    return start
@@ -0,0 +1,169 @@
+import threading
+
+import pytest
+
+import db
+from tournament import StandingsTable
+
+
+def scores(client, t_id):
+    schedule = client.get(f'/api/tournament/{t_id}').get_json()['groups'][0]['schedule']
+    return [(m['score1'], m['score2']) for m in schedule]
+
+
+def fresh_state(web, t_id):
+    """The tournament as loaded from the database, bypassing the cache."""
+    revision, (_, data) = db.load_current(web.get_db(), t_id)
+    web._rank_groups(data)
+    return revision, data
+
+
+def ranked(data):
+    return [[(s.name, s.points, s.gd, s.legs) for s in g['ranked']] for g in data['groups']]
+
+
+def replayed(data):
+    """``ranked`` worked out from the stored matches alone."""
+    return [
+        [(s.name, s.points, s.gd, s.legs)
+         for s in StandingsTable.from_matches(g['players'], g['schedule']).ranked()]
+        for g in data['groups']
+    ]
+
+
+@pytest.fixture
+def compete(web, monkeypatch):
+    """Have a rival scorer commit while a write on the main thread is planned.
+
+    ``rivals`` holds one batch of results per optimistic attempt. Each runs
+    on its own thread and connection after the attempt has read the state
+    and before its compare-and-swap."""
+    plan = web._plan_results
+
+    def install(t_id, rivals):
+        rivals = list(rivals)
+
+        def planned(data, results):
+            if threading.current_thread() is threading.main_thread() \
+                    and not web.get_db().in_transaction and rivals:
+                batch = rivals.pop(0)
+
+                def rival():
+                    with web.app.app_context():
+                        web._write_results(t_id, batch)
+                thread = threading.Thread(target=rival)
+                thread.start()
+                thread.join()
+            return plan(data, results)
+
+        monkeypatch.setattr(web, '_plan_results', planned)
+    return install
+
+
+def test_conflicting_write_is_redone_on_fresh_state(web, admin, start, compete):
+    t_id = start(['a', 'b', 'c', 'd'])
+    # the rival plays every other match, so both players of match 0 get
+    # results the first attempt did not see
+    compete(t_id, [[('A', i, 3, i % 3) for i in range(1, 6)]])
+    with web.app.app_context():
+        assert web._write_results(t_id, [('A', 0, 3, 2)]) == 2
+        revision, data = fresh_state(web, t_id)
+        assert revision == 2
+        assert ranked(data) == replayed(data)
+        assert ranked(web._load_state(t_id)[1]) == ranked(data)
+    assert scores(admin, t_id) == [(3, 2), *((3, i % 3) for i in range(1, 6))]
+
+
+def test_write_on_the_same_match_wins_after_the_conflict(web, admin, start, compete):
+    t_id = start(['a', 'b', 'c', 'd'])
+    compete(t_id, [[('A', 0, 3, 0)]])
+    with web.app.app_context():
+        assert web._write_results(t_id, [('A', 0, 0, 3)]) == 2
+        _, data = fresh_state(web, t_id)
+    # the rival's result is taken back in full, not added to
+    assert ranked(data) == replayed(data)
+    assert scores(admin, t_id)[0] == (0, 3)
+
+
+def test_last_attempt_takes_the_write_lock(web, admin, start, compete, monkeypatch):
+    monkeypatch.setitem(web.app.config, 'WRITE_RETRIES', 2)
+    t_id = start(['a', 'b', 'c', 'd'])
+    compete(t_id, [[('A', 1, 1, 0)], [('A', 1, 2, 0)], [('A', 1, 3, 0)]])
+    with web.app.app_context():
+        # both optimistic attempts lose; the third reads under the lock
+        assert web._write_results(t_id, [('A', 0, 3, 1)]) == 3
+    assert scores(admin, t_id)[:2] == [(3, 1), (2, 0)]
+
+
+def test_unchanged_result_is_not_written(web, admin, start):
+    t_id = start(['a', 'b', 'c'])
+    with web.app.app_context():
+        assert web._write_results(t_id, [('A', 0, 3, 1)]) == 1
+        assert web._write_results(t_id, [('A', 0, 3, 1)]) is None
+        assert db.get_revision(web.get_db(), t_id) == 1
+
+
+def test_bad_batch_writes_nothing(web, admin, start):
+    t_id = start(['a', 'b', 'c', 'd'])
+    response = admin.post(f'/api/tournament/{t_id}/scores', json=[['A', 0, 3, 1], ['A', 99, 3, 1]])
+    assert response.status_code == 400
+    assert scores(admin, t_id)[0] == (None, None)
+    with web.app.app_context():
+        assert db.get_revision(web.get_db(), t_id) == 0
+
+
+def test_cached_state_matches_the_database(web, admin, start):
+    t_id = start([f'p{i}' for i in range(8)], groups=2)
+    state = admin.get(f'/api/tournament/{t_id}').get_json()
+    results = [
+        [g['name'], m['index'], (m['index'] * 7) % 4, (m['index'] * 5) % 4]
+        for g in state['groups'] for m in g['schedule']
+    ]
+    admin.post(f'/api/tournament/{t_id}/scores', json=results[:5])
+    admin.post(f'/api/tournament/{t_id}/scores', json=results)
+    admin.post(f'/api/tournament/{t_id}/scores', json=[['sfs', 0, 3, 1], ['sfs', 1, 0, 3]])
+    admin.post(f'/api/tournament/{t_id}/undo')
+    with web.app.app_context():
+        revision, data = fresh_state(web, t_id)
+        cached_revision, (_, cached) = web._load_state_at(t_id)
+    assert cached_revision == revision == 4
+    assert web._stored_state(cached) == web._stored_state(data)
+    assert ranked(cached) == ranked(data)
+
+
+def test_players_entered_twice_are_kept_once(web, admin, start):
+    t_id = start(['a', 'Jan', 'a', 'jan ', 'b', 'c'])
+    state = admin.get(f'/api/tournament/{t_id}').get_json()
+    assert sorted(s['name'] for s in state['standings']['A']) == ['Jan', 'a', 'b', 'c']
+    results = [['A', m['index'], 3, 1] for m in state['groups'][0]['schedule']]
+    assert admin.post(f'/api/tournament/{t_id}/scores', json=results).status_code == 200
+    client = web.app.test_client()
+    client.post('/login', data={'username': web.ADMIN_USERNAME, 'password': web.ADMIN_PASSWORD})
+    for name in ('Zoë', ' zoë', 'ZOË'):
+        client.post('/add', data={'player_name': name})
+    with client.session_transaction() as session:
+        assert session['players'] == ['Zoë']
+
+
+def test_match_between_one_indexed_player_is_not_rated(web, start):
+    t_id = start(['a', 'b', 'c'])
+    with web.app.app_context():
+        conn = web.get_db()
+        db.index_results(conn, t_id, [('A', 0, 'Jan', 'jan ', 3, 1)])
+        rows = conn.execute(
+            'SELECT COUNT(*) FROM results WHERE tournament_id=? AND stage=?', (t_id, 'A')
+        ).fetchone()[0]
+        conn.rollback()
+    assert rows == 0
+
+
+@pytest.mark.parametrize('advance, kept', [(-1, 1), (0, 1), (2, 2), (9, 3)])
+def test_advance_is_kept_within_the_smallest_group(web, admin, advance, kept):
+    admin.post('/start', data={
+        'players_json': '["a", "b", "c", "d", "e", "f", "g"]', 'groups': 2, 'advance': advance,
+    })
+    with admin.session_transaction() as session:
+        t_id = session['current_tournament_id']
+    with web.app.app_context():
+        assert web._load_state(t_id)[1]['advance'] == kept
+    assert admin.get(f'/api/tournament/{t_id}/odds').status_code == 200
@@ -0,0 +1,64 @@
+import itertools
+
+import pytest
+
+from tournament import BoardMatch, board_lower_bound, schedule_boards
+
+
+def round_robin(n):
+    players = [f'p{i}' for i in range(n)]
+    return [
+        BoardMatch(('A', i), pair, order=(0, i))
+        for i, pair in enumerate(itertools.combinations(players, 2))
+    ]
+
+
+@pytest.mark.parametrize('n, boards, rest', [(5, 2, 0), (8, 4, 0), (8, 3, 1), (12, 4, 2)])
+def test_plan_keeps_players_to_one_match_and_their_rest(n, boards, rest):
+    matches = round_robin(n)
+    slots, unscheduled = schedule_boards(matches, boards, rest)
+    assert unscheduled == []
+    assert sorted(m.key for slot in slots for m in slot) == sorted(m.key for m in matches)
+    last = {}
+    for t, slot in enumerate(slots):
+        assert len(slot) <= boards
+        playing = [p for m in slot for p in m.players]
+        assert len(playing) == len(set(playing))
+        for p in playing:
+            assert t - last.get(p, -rest - 1) > rest
+            last[p] = t
+    assert len(slots) >= board_lower_bound(matches, boards, rest)
+
+
+def test_knockout_waits_for_its_feeders_and_their_rest():
+    matches = [
+        BoardMatch(('sfs', 0), ('a', 'b'), order=(1, 0)),
+        BoardMatch(('sfs', 1), ('c', 'd'), order=(1, 1)),
+        BoardMatch(('final', 0), (), after=(('sfs', 0), ('sfs', 1)), order=(2, 0)),
+        BoardMatch(('r', 0), ('e', 'f'), after=(('missing', 0),), order=(0, 0)),
+    ]
+    slots, unscheduled = schedule_boards(matches, 1, 1)
+    assert [[m.key for m in slot] for slot in slots] == [
+        [('sfs', 0)], [('sfs', 1)], [], [('final', 0)],
+    ]
+    assert [m.key for m in unscheduled] == [('r', 0)]
+
+
+def test_round_robin_plan_reaches_the_lower_bound():
+    matches = round_robin(16)
+    slots, _ = schedule_boards(matches, 4)
+    assert len(slots) == board_lower_bound(matches, 4) == 30
+
+
+def test_plan_is_cached_per_revision_and_boards(web, admin, start):
+    t_id = start(['a', 'b', 'c', 'd', 'e'])
+    with web.app.app_context():
+        plan = web.board_plan(t_id, 2, 0)
+        assert web.board_plan(t_id, 2, 0) is plan
+        assert web.board_plan(t_id, 1, 0) is not plan
+    admin.post(f'/api/tournament/{t_id}/scores', json=[['A', 0, 3, 1]])
+    with web.app.app_context():
+        replanned = web.board_plan(t_id, 2, 0)
+    assert replanned['revision'] == plan['revision'] + 1
+    assert replanned['makespan'] <= plan['makespan']
+    assert sum(len(s['matches']) for s in replanned['slots']) == 9
@@ -0,0 +1,74 @@
+import pytest
+
+from tournament import bracket_layout, bracket_matches, build_bracket, stage_rank
+
+
+def test_no_bracket_below_two_players():
+    assert bracket_layout(0) == []
+    assert bracket_layout(1) == []
+    assert build_bracket(['a']) is None
+
+
+def test_eight_players_meet_in_seed_order():
+    assert bracket_layout(8) == [
+        ('qfs', [(1, 8), (4, 5), (2, 7), (3, 6)]),
+        ('sfs', [(('qfs', 0), ('qfs', 1)), (('qfs', 2), ('qfs', 3))]),
+        ('final', [(('sfs', 0), ('sfs', 1))]),
+    ]
+
+
+def test_top_seeds_get_byes():
+    assert bracket_layout(6) == [
+        ('playins', [(4, 5), (3, 6)]),
+        ('sfs', [(1, ('playins', 0)), (2, ('playins', 1))]),
+        ('final', [(('sfs', 0), ('sfs', 1))]),
+    ]
+
+
+@pytest.mark.parametrize('qualifiers', range(2, 70))
+def test_layout_plays_every_seed_down_to_one_winner(qualifiers):
+    layout = bracket_layout(qualifiers)
+    seeds, fed = [], []
+    for stage, pairs in layout:
+        for pair in pairs:
+            for side in pair:
+                (seeds if isinstance(side, int) else fed).append(side)
+    assert sorted(seeds) == list(range(1, qualifiers + 1))
+    assert sum(len(pairs) for _, pairs in layout) == qualifiers - 1
+    # every match but the final feeds exactly one later match
+    matches = [(stage, j) for stage, pairs in layout for j in range(len(pairs))]
+    assert sorted(fed) == sorted(matches[:-1])
+    assert layout[-1][0] == 'final'
+    ranks = [stage_rank(stage) for stage, _ in layout]
+    assert ranks == sorted(ranks)
+
+
+@pytest.mark.parametrize('qualifiers', [3, 5, 6, 7, 11, 12, 13, 24, 33])
+def test_byes_go_to_the_best_seeds(qualifiers):
+    opening = bracket_layout(qualifiers)[0][1]
+    playing = sorted(seed for pair in opening for seed in pair)
+    assert playing == list(range(qualifiers - len(playing) + 1, qualifiers + 1))
+
+
+@pytest.mark.parametrize('qualifiers', [2, 4, 5, 8, 10, 12, 16, 20, 32, 48])
+def test_build_bracket_links_every_match(qualifiers):
+    seeds = [f'p{i}' for i in range(1, qualifiers + 1)]
+    bracket = build_bracket(seeds)
+    assert bracket['size'] == qualifiers
+    assert bracket['layout'] == 'graph'
+    layout = bracket_layout(qualifiers)
+    assert bracket['stages'] == [stage for stage, _ in layout]
+    for stage, pairs in layout:
+        matches = bracket_matches(bracket, stage)
+        assert len(matches) == len(pairs)
+        for j, pair in enumerate(pairs):
+            m = matches[j]
+            assert m['score1'] is None and m['score2'] is None
+            for slot, side in enumerate(pair, 1):
+                name = m['p1' if slot == 1 else 'p2']
+                if isinstance(side, int):
+                    assert name == seeds[side - 1]
+                else:
+                    assert name is None
+                    assert bracket_matches(bracket, side[0])[side[1]]['next'] == [stage, j, slot]
+    assert bracket['final']['next'] is None
@@ -0,0 +1,102 @@
+from tournament import (
+    Standing,
+    bracket_matches,
+    build_bracket,
+    knockout_seeds,
+    match_winner,
+    record_result,
+)
+
+SEEDS = [f'p{i}' for i in range(1, 9)]
+
+
+def played_bracket():
+    """Eight players with every match played by the better seed."""
+    bracket = build_bracket(SEEDS)
+    for stage in bracket['stages']:
+        for j in range(len(bracket_matches(bracket, stage))):
+            record_result(bracket, stage, j, 3, 1)
+    return bracket
+
+
+def test_winners_move_on():
+    bracket = build_bracket(SEEDS)
+    assert record_result(bracket, 'qfs', 0, 3, 1) == [('qfs', 0), ('sfs', 0)]
+    assert bracket['sfs'][0]['p1'] == 'p1'
+    record_result(bracket, 'qfs', 1, 0, 3)
+    assert bracket['sfs'][0]['p2'] == 'p5'
+    assert bracket['final']['p1'] is None
+
+
+def test_full_bracket_crowns_the_top_seed():
+    bracket = played_bracket()
+    assert [m['p1'] for m in bracket['sfs']] == ['p1', 'p2']
+    assert match_winner(bracket['final']) == 'p1'
+
+
+def test_correction_with_the_same_winner_changes_one_match():
+    bracket = played_bracket()
+    assert record_result(bracket, 'qfs', 0, 3, 2) == [('qfs', 0)]
+    assert bracket['sfs'][0]['score1'] == 3
+    assert match_winner(bracket['final']) == 'p1'
+
+
+def test_correction_clears_the_results_the_old_winner_played():
+    bracket = played_bracket()
+    changed = record_result(bracket, 'qfs', 0, 1, 3)
+    assert changed == [('qfs', 0), ('sfs', 0), ('final', 0)]
+    assert bracket['sfs'][0]['p1'] == 'p8'
+    assert (bracket['sfs'][0]['score1'], bracket['sfs'][0]['score2']) == (None, None)
+    # the final lost the semifinal's winner and its own result
+    assert bracket['final']['p1'] is None
+    assert bracket['final']['p2'] == 'p2'
+    assert (bracket['final']['score1'], bracket['final']['score2']) == (None, None)
+    # the other half is untouched
+    assert bracket['sfs'][1]['score1'] == 3
+
+
+def test_cascade_stops_at_an_unplayed_match():
+    bracket = played_bracket()
+    record_result(bracket, 'sfs', 0, None, None)
+    changed = record_result(bracket, 'qfs', 0, 1, 3)
+    assert changed == [('qfs', 0), ('sfs', 0)]
+    assert bracket['final']['p1'] is None
+
+
+def test_clearing_a_result_empties_the_next_slot():
+    bracket = played_bracket()
+    changed = record_result(bracket, 'qfs', 3, None, None)
+    assert changed == [('qfs', 3), ('sfs', 1), ('final', 0)]
+    assert bracket['sfs'][1]['p2'] is None
+    assert bracket['final']['p2'] is None
+
+
+def test_players_named_like_placeholders_can_be_scored(web, admin, start):
+    t_id = start(['Winnerton', 'b', 'c', 'd', 'e'])
+    schedule = admin.get(f'/api/tournament/{t_id}').get_json()['groups'][0]['schedule']
+    results = []
+    for m in schedule:
+        # Winnerton wins every match and goes through as the top seed
+        if 'Winnerton' in (m['p1'], m['p2']):
+            score = (3, 0) if m['p1'] == 'Winnerton' else (0, 3)
+        else:
+            score = (3, 1)
+        results.append(['A', m['index'], *score])
+    assert admin.post(f'/api/tournament/{t_id}/scores', json=results).status_code == 200
+    semifinal = admin.get(f'/api/tournament/{t_id}').get_json()['knockout']['stages'][0]
+    assert semifinal['stage'] == 'sfs'
+    assert semifinal['matches'][0]['p1'] == 'Winnerton'
+    response = admin.post(f'/api/tournament/{t_id}/scores', json=[['sfs', 0, 3, 1]])
+    assert response.status_code == 200
+    final = response.get_json()['knockout']['stages'][-1]['matches'][0]
+    assert final['p1'] == 'Winnerton'
+
+
+def test_knockout_seeds_take_the_places_asked_for():
+    rankings = [
+        [Standing('a', 6), Standing('b', 3), Standing('c', 0)],
+        [Standing('d', 3), Standing('e', 3), Standing('f', 0)],
+    ]
+    assert knockout_seeds(rankings) == ['a', 'd', 'b', 'e']
+    assert knockout_seeds(rankings, 1) == ['a', 'd']
+    assert knockout_seeds(rankings, 0) == []
@@ -0,0 +1,103 @@
+import time
+
+from flask_login.utils import encode_cookie
+
+import db
+
+
+def session_rows(web):
+    with web.app.app_context():
+        return web.get_db().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+
+def login(client, web):
+    client.post('/login', data={'username': web.ADMIN_USERNAME, 'password': web.ADMIN_PASSWORD})
+
+
+def test_login_issues_a_new_session_id(web, start):
+    t_id = start(['a', 'b', 'c'])
+    start(['d', 'e', 'f'])
+    attacker = web.app.test_client()
+    attacker.post('/login', data={'username': web.ADMIN_USERNAME, 'password': 'wrong'})
+    with attacker.session_transaction() as session:
+        session['players'] = ['x']
+    planted = attacker.get_cookie('session').value
+
+    victim = web.app.test_client()
+    victim.set_cookie('session', planted)
+    login(victim, web)
+    assert victim.get_cookie('session').value != planted
+
+    attacker.set_cookie('session', planted)
+    assert attacker.post(f'/api/tournament/{t_id}/undo').status_code == 401
+    assert victim.post(f'/api/tournament/{t_id}/undo').status_code == 409
+
+
+def test_logout_drops_the_stored_session(web):
+    client = web.app.test_client()
+    login(client, web)
+    client.post('/add', data={'player_name': 'a'})
+    before = client.get_cookie('session').value
+    rows = session_rows(web)
+    client.post('/logout')
+    assert session_rows(web) == rows
+    assert client.get_cookie('session').value != before
+    stale = web.app.test_client()
+    stale.set_cookie('session', before)
+    with stale.session_transaction() as session:
+        assert dict(session) == {}
+
+
+def test_spectators_get_no_session(web, start):
+    t_id = start(['a', 'b', 'c', 'd'])
+    rows = session_rows(web)
+    for _ in range(3):
+        client = web.app.test_client()
+        for path in (f'/tournament/{t_id}', f'/tournament/{t_id}/knockout',
+                     f'/tournament/{t_id}/boards', '/'):
+            response = client.get(path)
+            assert response.status_code == 200
+            assert 'Set-Cookie' not in response.headers
+        assert b'Test Cup' in client.get(f'/tournament/{t_id}').data
+    assert session_rows(web) == rows
+
+
+def test_cached_page_checks_the_revision_with_several_workers(web, admin, start, monkeypatch):
+    monkeypatch.setitem(web.app.config, 'MULTI_WORKER', True)
+    t_id = start(['a', 'b', 'c'])
+    spectator = web.app.test_client()
+    spectator.get(f'/tournament/{t_id}')
+    assert b'data-revision="0"' in spectator.get(f'/tournament/{t_id}').data
+    # a write by another worker: the stored revision moves on, this
+    # process's caches do not hear about it
+    with web.app.app_context():
+        conn = web.get_db()
+        db.begin_write(conn)
+        db.bump_revision(conn, t_id)
+        conn.commit()
+    assert b'data-revision="1"' in spectator.get(f'/tournament/{t_id}').data
+
+
+def test_login_ends_with_its_stored_session(web, start):
+    t_id = start(['a', 'b', 'c'])
+    client = web.app.test_client()
+    login(client, web)
+    assert client.get_cookie('remember_token') is None
+    assert client.post(f'/api/tournament/{t_id}/undo').status_code == 409
+    with web.app.app_context():
+        conn = web.get_db()
+        expires = conn.execute('SELECT MAX(expires) FROM sessions').fetchone()[0]
+        assert expires - time.time() > web.app.permanent_session_lifetime.total_seconds() - 60
+        conn.execute('DELETE FROM sessions')
+        conn.commit()
+    assert client.post(f'/api/tournament/{t_id}/undo').status_code == 401
+
+
+def test_old_remember_cookie_no_longer_logs_in(web, start):
+    t_id = start(['a', 'b', 'c'])
+    with web.app.test_request_context():
+        cookie = encode_cookie(web.ADMIN_USERNAME)
+    client = web.app.test_client()
+    client.set_cookie('remember_token', cookie)
+    assert client.post(f'/api/tournament/{t_id}/undo').status_code == 401
+    assert client.get_cookie('remember_token') is None
@@ -0,0 +1,84 @@
+import itertools
+import random
+
+import pytest
+
+import simulate
+from tournament import StandingsTable
+
+np = pytest.importorskip('numpy')
+
+
+def group(name, players, results):
+    """A stored group with ``results`` as ``((p1, p2), (score1, score2))``."""
+    schedule = [
+        {'p1': a, 'p2': b, 'score1': s1, 'score2': s2} for (a, b), (s1, s2) in results
+    ]
+    table = StandingsTable.from_matches(players, schedule)
+    standings = [
+        {'name': s.name, 'points': s.points, 'gd': s.gd, 'legs': s.legs}
+        for s in (table[p] for p in players)
+    ]
+    return {'name': name, 'players': players, 'schedule': schedule, 'standings': standings}
+
+
+def both_engines(data, runs, monkeypatch):
+    numpy = simulate.simulate(data, runs=runs, seed=1)
+    with monkeypatch.context() as m:
+        m.setattr(simulate, 'np', None)
+        python = simulate.simulate(data, runs=runs, seed=1)
+    assert (numpy['engine'], python['engine']) == ('numpy', 'python')
+    return numpy['players'], python['players']
+
+
+def test_finished_group_qualifies_on_head_to_head(monkeypatch):
+    # b and e finish level on points, leg difference and legs; e won their
+    # match, so e takes the last place through despite the draw order
+    results = [
+        (('a', 'b'), (2, 3)), (('a', 'c'), (3, 0)), (('a', 'd'), (2, 3)),
+        (('a', 'e'), (3, 2)), (('b', 'c'), (2, 3)), (('b', 'd'), (1, 3)),
+        (('b', 'e'), (2, 3)), (('c', 'd'), (3, 0)), (('c', 'e'), (3, 2)),
+        (('d', 'e'), (3, 1)),
+    ]
+    data = {'groups': [group('A', list('abcde'), results)], 'advance': None}
+    numpy, python = both_engines(data, 50, monkeypatch)
+    for players in (numpy, python):
+        assert {p['name']: p['qualify'] for p in players} == \
+            {'a': 1.0, 'b': 0.0, 'c': 1.0, 'd': 1.0, 'e': 1.0}
+        assert [p['seeds'] for p in players if p['name'] == 'e'] == [[0, 0, 0, 1.0]]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_engines_seed_finished_groups_alike(seed, monkeypatch):
+    rng = random.Random(seed)
+    scorelines = [(3, 0), (3, 1), (3, 2), (0, 3), (1, 3), (2, 3)]
+    groups = []
+    for name, players in (('A', list('abcde')), ('B', list('fghi'))):
+        results = [(pair, rng.choice(scorelines)) for pair in itertools.combinations(players, 2)]
+        groups.append(group(name, players, results))
+    data = {'groups': groups, 'advance': 3}
+    numpy, python = both_engines(data, 20, monkeypatch)
+    assert [(p['qualify'], p['seeds']) for p in numpy] == \
+        [(p['qualify'], p['seeds']) for p in python]
+
+
+def test_engines_agree_on_open_groups(monkeypatch):
+    players = list('abcde')
+    matches = list(itertools.combinations(players, 2))
+    played = [(pair, (3, 2)) for pair in matches[:6]]
+    data = {'groups': [group('A', players, played)], 'advance': None}
+    for m in matches[6:]:
+        data['groups'][0]['schedule'].append({'p1': m[0], 'p2': m[1], 'score1': None, 'score2': None})
+    numpy, python = both_engines(data, 4000, monkeypatch)
+    for a, b in zip(numpy, python):
+        assert a['qualify'] == pytest.approx(b['qualify'], abs=0.04)
+        assert a['seeds'] == pytest.approx(b['seeds'], abs=0.04)
+
+
+@pytest.mark.parametrize('advance', [0, -1])
+def test_nobody_qualifies_without_places(advance, monkeypatch):
+    groups = [group('A', list('ab'), [(('a', 'b'), (3, 1))]), group('B', list('cd'), [])]
+    groups[1]['schedule'].append({'p1': 'c', 'p2': 'd', 'score1': None, 'score2': None})
+    data = {'groups': groups, 'advance': advance}
+    for players in both_engines(data, 10, monkeypatch):
+        assert [p['qualify'] for p in players] == [0.0] * 4
@@ -0,0 +1,92 @@
+from tournament import StandingsTable
+
+
+def names(table):
+    return [s.name for s in table.ranked()]
+
+
+def test_ranked_on_points_then_leg_difference_then_legs():
+    table = StandingsTable(['a', 'b', 'c', 'd'])
+    table.apply('a', 'b', 3, 0)
+    table.apply('c', 'd', 3, 2)
+    table.apply('b', 'd', 2, 2)
+    assert names(table) == ['a', 'c', 'd', 'b']
+    assert (table['a'].points, table['a'].gd, table['a'].legs) == (3, 3, 3)
+    assert (table['b'].points, table['b'].gd, table['b'].legs) == (1, -3, 2)
+
+
+def test_head_to_head_splits_a_two_way_tie():
+    # b and a finish level on points, leg difference and legs; a won
+    # their match, so it goes ahead of b despite the draw order
+    table = StandingsTable(['b', 'a', 'c', 'd'])
+    table.apply('a', 'b', 3, 2)
+    table.apply('a', 'c', 2, 3)
+    table.apply('b', 'c', 3, 2)
+    table.apply('c', 'd', 3, 0)
+    assert [(s.points, s.gd, s.legs) for s in (table['a'], table['b'])] == [(3, 0, 5)] * 2
+    assert names(table) == ['c', 'a', 'b', 'd']
+
+
+def test_level_head_to_head_falls_back_to_draw_order():
+    # a, b and c beat each other 3-2 in turn, so nothing else splits them
+    table = StandingsTable(['c', 'b', 'a', 'd'])
+    table.apply('a', 'b', 3, 2)
+    table.apply('b', 'c', 3, 2)
+    table.apply('c', 'a', 3, 2)
+    assert names(table)[:3] == ['c', 'b', 'a']
+
+
+def test_head_to_head_leg_difference_decides_a_cycle():
+    table = StandingsTable(['b', 'c', 'a', 'd'])
+    table.apply('a', 'b', 3, 0)
+    table.apply('b', 'c', 3, 2)
+    table.apply('c', 'a', 3, 2)
+    # the results against d level a, b and c on leg difference and legs
+    table.apply('a', 'd', 0, 5)
+    table.apply('b', 'd', 2, 3)
+    table.apply('c', 'd', 0, 3)
+    assert {(table[n].points, table[n].gd, table[n].legs) for n in 'abc'} == {(3, -3, 5)}
+    # one win each between them, so their leg difference in those matches decides
+    assert names(table) == ['d', 'a', 'c', 'b']
+
+
+def test_revert_restores_the_table():
+    table = StandingsTable(['a', 'b', 'c'])
+    table.apply('a', 'b', 3, 1)
+    table.apply('b', 'c', 3, 2)
+    table.revert('a', 'b', 3, 1)
+    table.apply('a', 'b', 1, 3)
+    fresh = StandingsTable(['a', 'b', 'c'])
+    fresh.apply('b', 'c', 3, 2)
+    fresh.apply('a', 'b', 1, 3)
+    assert [(s.name, s.points, s.gd, s.legs) for s in table.ranked()] == \
+        [(s.name, s.points, s.gd, s.legs) for s in fresh.ranked()]
+
+
+def test_copy_is_independent():
+    table = StandingsTable(['a', 'b'])
+    table.apply('a', 'b', 3, 2)
+    copy = table.copy()
+    copy.revert('a', 'b', 3, 2)
+    copy.apply('a', 'b', 0, 3)
+    assert names(table) == ['a', 'b']
+    assert names(copy) == ['b', 'a']
+    assert table['a'].points == 3
+
+
+def test_from_matches_with_stored_standings_keeps_head_to_head():
+    matches = [
+        {'p1': 'a', 'p2': 'b', 'score1': 3, 'score2': 2},
+        {'p1': 'a', 'p2': 'c', 'score1': 2, 'score2': 3},
+        {'p1': 'b', 'p2': 'c', 'score1': 3, 'score2': 2},
+        {'p1': 'c', 'p2': 'd', 'score1': None, 'score2': None},
+    ]
+    standings = [
+        {'name': 'b', 'points': 3, 'gd': 0, 'legs': 5},
+        {'name': 'a', 'points': 3, 'gd': 0, 'legs': 5},
+        {'name': 'c', 'points': 3, 'gd': 0, 'legs': 5},
+        {'name': 'd', 'points': 0, 'gd': 0, 'legs': 0},
+    ]
+    rebuilt = StandingsTable.from_matches(['b', 'a', 'c', 'd'], matches)
+    stored = StandingsTable.from_matches(['b', 'a', 'c', 'd'], matches, standings)
+    assert names(stored) == names(rebuilt)
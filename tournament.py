@@ -1,8 +1,12 @@
+import heapq
 import random
+import string
+from array import array
+from collections import Counter
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-@dataclass
+@dataclass(slots=True)
 class Match:
     p1: str
     p2: str
@@ -10,33 +14,605 @@ class Match:
     score2: Optional[int] = None
     round: int = 0
 
-@dataclass
+@dataclass(slots=True)
 class Standing:
     name: str
     points: int = 0
     gd: int = 0
+    legs: int = 0
 
-def draw_group(players: List[str]) -> List[str]:
-    """Randomly shuffle players into a single group."""
-    random.shuffle(players)
-    return players
+
+class StandingsTable:
+    """Group standings with O(1) player lookup and an incrementally kept order.
+
+    Players are ranked on points, leg difference and legs won. Players still
+    level after that are split by a head-to-head mini-table (points, then leg
+    difference in the matches between them) and finally by draw order."""
+
+    def __init__(self, players: Iterable[str] = ()):
+        self._rows: Dict[str, Standing] = {}
+        self._seq: Dict[str, int] = {}
+        self._order: List[Standing] = []
+        self._pos: Dict[str, int] = {}
+        # (a, b) -> (points a took off b, leg difference of a against b)
+        self._h2h: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        for name in players:
+            self.add(Standing(name))
+
+    @classmethod
+    def from_rows(cls, rows) -> 'StandingsTable':
+        """Build a table from stored standings (dicts or ``Standing`` objects)."""
+        table = cls()
+        for r in rows:
+            if isinstance(r, dict):
+                r = Standing(r['name'], r.get('points', 0), r.get('gd', 0), r.get('legs', 0))
+            table.add(r)
+        return table
+
+    @classmethod
+    def from_matches(cls, players: Iterable[str], matches, standings=None) -> 'StandingsTable':
+        """Build a table for ``players`` from played ``matches``.
+
+        When the aggregated ``standings`` are already known they are used as
+        they are and the matches only feed the head-to-head records."""
+        if standings is None:
+            table = cls(players)
+            for m in matches:
+                table.apply(*_match_tuple(m))
+        else:
+            table = cls.from_rows(standings)
+            for m in matches:
+                table._record_h2h(*_match_tuple(m), 1)
+        return table
+
+    def copy(self) -> 'StandingsTable':
+        """An independent copy, without replaying any match."""
+        table = StandingsTable()
+        table._rows = {name: Standing(s.name, s.points, s.gd, s.legs) for name, s in self._rows.items()}
+        table._seq = dict(self._seq)
+        table._order = [table._rows[s.name] for s in self._order]
+        table._pos = dict(self._pos)
+        table._h2h = dict(self._h2h)
+        return table
+
+    def add(self, standing: Standing):
+        self._seq[standing.name] = len(self._seq)
+        self._pos[standing.name] = len(self._order)
+        self._rows[standing.name] = standing
+        self._order.append(standing)
+        self._reposition(standing.name)
+
+    def __getitem__(self, name: str) -> Standing:
+        try:
+            return self._rows[name]
+        except KeyError:
+            raise ValueError("player not found") from None
+
+    def __contains__(self, name) -> bool:
+        return name in self._rows
+
+    def __iter__(self):
+        return iter(self._rows.values())
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def apply(self, p1: str, p2: str, score1: Optional[int], score2: Optional[int]):
+        """Add a result to the table; unplayed matches are ignored."""
+        self._update(p1, p2, score1, score2, 1)
+
+    def revert(self, p1: str, p2: str, score1: Optional[int], score2: Optional[int]):
+        """Take a previously applied result back out of the table."""
+        self._update(p1, p2, score1, score2, -1)
+
+    def _update(self, p1, p2, score1, score2, sign):
+        if score1 is None or score2 is None:
+            return
+        pts1, pts2 = _result_points(score1, score2)
+        # move one player at a time so the rest of the order stays sorted
+        for name, pts, won, lost in ((p1, pts1, score1, score2), (p2, pts2, score2, score1)):
+            s = self[name]
+            s.points += pts * sign
+            s.gd += (won - lost) * sign
+            s.legs += won * sign
+            self._reposition(name)
+        self._record_h2h(p1, p2, score1, score2, sign)
+
+    def _record_h2h(self, p1, p2, score1, score2, sign):
+        if score1 is None or score2 is None:
+            return
+        pts1, pts2 = _result_points(score1, score2)
+        for x, y, pts, diff in ((p1, p2, pts1, score1 - score2), (p2, p1, pts2, score2 - score1)):
+            # replaced rather than changed in place, so copies can share them
+            rec_pts, rec_diff = self._h2h.get((x, y), (0, 0))
+            self._h2h[x, y] = (rec_pts + pts * sign, rec_diff + diff * sign)
+
+    def _key(self, s: Standing):
+        return (-s.points, -s.gd, -s.legs, self._seq[s.name])
+
+    def _reposition(self, name: str):
+        # a single result moves a player a few places at most, so bubbling
+        # it into place is cheaper than re-sorting the whole table
+        order, pos = self._order, self._pos
+        i = pos[name]
+        key = self._key(order[i])
+        while i > 0 and self._key(order[i - 1]) > key:
+            order[i], order[i - 1] = order[i - 1], order[i]
+            pos[order[i].name] = i
+            i -= 1
+        while i < len(order) - 1 and self._key(order[i + 1]) < key:
+            order[i], order[i + 1] = order[i + 1], order[i]
+            pos[order[i].name] = i
+            i += 1
+        pos[name] = i
+
+    def ranked(self) -> List[Standing]:
+        """Standings in final order, head-to-head applied to tied runs only."""
+        result: List[Standing] = []
+        order = self._order
+        i = 0
+        while i < len(order):
+            j = i + 1
+            level = self._key(order[i])[:3]
+            while j < len(order) and self._key(order[j])[:3] == level:
+                j += 1
+            tied = order[i:j]
+            if len(tied) > 1:
+                tied = self._break_tie(tied)
+            result.extend(tied)
+            i = j
+        return result
+
+    def _break_tie(self, tied: List[Standing]) -> List[Standing]:
+        names = [s.name for s in tied]
+        mini = {}
+        for x in names:
+            pts = diff = 0
+            for y in names:
+                rec = self._h2h.get((x, y))
+                if rec is not None:
+                    pts += rec[0]
+                    diff += rec[1]
+            mini[x] = (-pts, -diff, self._seq[x])
+        return sorted(tied, key=lambda s: mini[s.name])
+
+
+def _result_points(score1: int, score2: int) -> Tuple[int, int]:
+    if score1 > score2:
+        return 3, 0
+    if score2 > score1:
+        return 0, 3
+    return 1, 1
+
+
+def _match_tuple(m):
+    if isinstance(m, dict):
+        return m['p1'], m['p2'], m.get('score1'), m.get('score2')
+    return m.p1, m.p2, m.score1, m.score2
+
+# groups are named A, B, C, ...
+MAX_GROUPS = len(string.ascii_uppercase)
+
+def draw_groups(players: List[str], groups: int = 1, seeded: bool = False) -> Dict[str, List[str]]:
+    """Draw players into ``groups`` groups named A, B, C, ...
+
+    The field is cut into pots of ``groups`` players, the first pot holding
+    the first players, and the pots are dealt in a snake (A to the last
+    group, then back) so every group gets a similar mix. With ``seeded`` the
+    players are taken to be in seed order and are only shuffled within their
+    pot; otherwise the whole field is shuffled first."""
+    groups = max(1, min(groups, MAX_GROUPS))
+    players = list(players)
+    if not seeded:
+        random.shuffle(players)
+    names = list(string.ascii_uppercase[:groups])
+    drawn: Dict[str, List[str]] = {name: [] for name in names}
+    for pot_no, start in enumerate(range(0, len(players), groups)):
+        pot = players[start:start + groups]
+        if seeded:
+            random.shuffle(pot)
+        order = names if pot_no % 2 == 0 else names[::-1]
+        for name, player in zip(order, pot):
+            drawn[name].append(player)
+    return drawn
 
 def schedule_round_robin(players: List[str]) -> List[Match]:
     """Create a round-robin schedule returning matches with round numbers."""
-    players = players.copy()
-    if len(players) % 2 == 1:
-        players.append(None)
-    n = len(players)
-    rounds: List[Match] = []
-    for r in range(n - 1):
-        for i in range(n // 2):
-            p1 = players[i]
-            p2 = players[n - 1 - i]
-            if p1 is not None and p2 is not None:
-                rounds.append(Match(p1, p2, round=r + 1))
-        # rotate list except the first element
-        players = [players[0]] + players[-1:] + players[1:-1]
-    return rounds
+    return list(iter_round_robin(players))
+
+def round_robin_rounds(count: int) -> int:
+    """Number of rounds a round robin of ``count`` players takes."""
+    return count - 1 + count % 2
+
+def _circle_pairs(n: int, r: int) -> Iterator[Tuple[int, int]]:
+    # Circle method: the first slot stays put while the others rotate one
+    # place per round, so after r rounds slot i holds player 1 + (i-1-r) mod (n-1).
+    # With an odd field the last index is the bye.
+    m = n - 1
+    for i in range(n // 2):
+        a = 0 if i == 0 else 1 + (i - 1 - r) % m
+        yield a, 1 + (n - 2 - i - r) % m
+
+def round_robin_round(players: List[str], round_no: int) -> Iterator[Match]:
+    """Matches of round ``round_no`` (1-based), computed without earlier rounds."""
+    count = len(players)
+    for a, b in _circle_pairs(count + count % 2, round_no - 1):
+        if a < count and b < count:
+            yield Match(players[a], players[b], round=round_no)
+
+def iter_round_robin(players: List[str]) -> Iterator[Match]:
+    """Yield the round-robin schedule one match at a time, round by round."""
+    for r in range(round_robin_rounds(len(players))):
+        yield from round_robin_round(players, r + 1)
+
+class RoundRobinSchedule:
+    """A round-robin schedule kept as flat arrays of player indices.
+
+    Much smaller than a list of ``Match`` objects for big fields; ``rows()``
+    feeds the schedule to the database in one batch."""
+
+    __slots__ = ('players', 'p1', 'p2', 'rounds')
+
+    def __init__(self, players: List[str]):
+        self.players = list(players)
+        self.p1 = array('I')
+        self.p2 = array('I')
+        self.rounds = array('I')
+        count = len(players)
+        for r in range(round_robin_rounds(count)):
+            for a, b in _circle_pairs(count + count % 2, r):
+                if a < count and b < count:
+                    self.p1.append(a)
+                    self.p2.append(b)
+                    self.rounds.append(r + 1)
+
+    def __len__(self) -> int:
+        return len(self.rounds)
+
+    def __iter__(self) -> Iterator[Match]:
+        players = self.players
+        for a, b, r in zip(self.p1, self.p2, self.rounds):
+            yield Match(players[a], players[b], round=r)
+
+    def rows(self) -> Iterator[Tuple[int, int, str, str]]:
+        """``(index, round, p1, p2)`` for every match in schedule order."""
+        players = self.players
+        for i, (a, b, r) in enumerate(zip(self.p1, self.p2, self.rounds)):
+            yield i, r, players[a], players[b]
+
+@dataclass(slots=True)
+class BoardMatch:
+    """A match waiting for a board.
+
+    ``players`` are the players already known; ``after`` holds the keys of
+    the matches whose winners fill the other places. ``order`` breaks ties
+    between equally urgent matches, lowest first."""
+    key: Tuple
+    players: Tuple[str, ...]
+    after: Tuple = ()
+    order: Tuple = ()
+
+
+def board_lower_bound(matches: List[BoardMatch], boards: int, rest: int = 0) -> int:
+    """Slots no schedule of ``matches`` can finish in fewer of."""
+    if not matches:
+        return 0
+    load = Counter(p for m in matches for p in m.players)
+    busiest = max(load.values(), default=0)
+    return max(-(-len(matches) // boards), busiest + (busiest - 1) * rest)
+
+
+def schedule_boards(matches: List[BoardMatch], boards: int,
+                    rest: int = 0) -> Tuple[List[List[BoardMatch]], List[BoardMatch]]:
+    """Assign matches to ``boards`` boards in equal time slots.
+
+    Greedy list scheduling: each slot is filled with the most urgent matches
+    whose players are free, nobody plays twice in a slot and a player sits
+    out ``rest`` slots after each match. A match waits for the matches in its
+    ``after`` the same way, as their winners play in it. Urgency is the
+    number of matches still to come for its players plus the matches that
+    wait on it, so the busiest players and the knockout path are kept moving.
+    Returns the slots (a match's board is its position plus one) and the
+    matches that can never be scheduled because they wait on matches that
+    are not in the list."""
+    keys = {m.key for m in matches}
+    blocked = [m for m in matches if not keys.issuperset(m.after)]
+    # a match waiting on a blocked match is blocked as well
+    while True:
+        stuck = {m.key for m in blocked}
+        more = [m for m in matches if m.key not in stuck and stuck.intersection(m.after)]
+        if not more:
+            break
+        blocked.extend(more)
+    stuck = {m.key for m in blocked}
+    pending = [m for m in matches if m.key not in stuck]
+
+    # length of the longest chain of matches that need each match first
+    dependents: Dict[Tuple, List[Tuple]] = {}
+    for m in pending:
+        for k in m.after:
+            dependents.setdefault(k, []).append(m.key)
+    chain: Dict[Tuple, int] = {}
+
+    def downstream(key):
+        if key not in chain:
+            chain[key] = max((1 + downstream(k) for k in dependents.get(key, ())), default=0)
+        return chain[key]
+
+    load = Counter(p for m in pending for p in m.players)
+    # heap entries are (-urgency, rank), rank the place in ``order`` order
+    pending.sort(key=lambda m: m.order)
+    chains = [downstream(m.key) for m in pending]
+    players = [m.players for m in pending]
+
+    def entry(i):
+        return -sum([load[p] for p in players[i]]) - chains[i], i
+
+    # matches wait in ``due`` under the first slot they may be played in and
+    # then in a heap on urgency. Urgency only drops as players get through
+    # their matches, so an entry is re-keyed when it comes out stale.
+    index = {m.key: i for i, m in enumerate(pending)}
+    waiting = [len(m.after) for m in pending]
+    due: Dict[int, List[int]] = {}
+    heap = [entry(i) for i, m in enumerate(pending) if not m.after]
+    heapq.heapify(heap)
+    free_at: Dict[str, int] = {}
+    played_at: Dict[Tuple, int] = {}
+    slots: List[List[BoardMatch]] = []
+    left = len(pending)
+    while left and (heap or due):
+        t = len(slots)
+        for i in due.pop(t, ()):
+            heapq.heappush(heap, entry(i))
+        slot: List[BoardMatch] = []
+        busy = set()
+        later = []
+        while heap and len(slot) < boards:
+            popped = heapq.heappop(heap)
+            i = popped[1]
+            current = entry(i)
+            if current != popped:
+                heapq.heappush(heap, current)
+            elif not busy.isdisjoint(players[i]):
+                later.append(popped)
+            elif any(free_at.get(p, 0) > t for p in players[i]):
+                due.setdefault(max(free_at.get(p, 0) for p in players[i]), []).append(i)
+            else:
+                slot.append(pending[i])
+                busy.update(players[i])
+        for popped in later:
+            heapq.heappush(heap, popped)
+        for m in slot:
+            played_at[m.key] = t
+            for p in m.players:
+                free_at[p] = t + 1 + rest
+                load[p] -= 1
+            for k in dependents.get(m.key, ()):
+                j = index[k]
+                waiting[j] -= 1
+                if not waiting[j]:
+                    due.setdefault(max(played_at[a] for a in pending[j].after) + rest + 1, []).append(j)
+        left -= len(slot)
+        slots.append(slot)
+    return slots, blocked + [m for m in matches if m.key not in stuck and m.key not in played_at]
+
+
+STAGE_TITLES = {
+    'playins': ('Play-ins', 'Play-in'),
+    'qfs': ('Quarterfinals', 'Quarterfinal'),
+    'sfs': ('Semifinals', 'Semifinal'),
+    'final': ('Final', 'Final'),
+}
+
+_STAGE_SIZES = {'final': 2, 'sfs': 4, 'qfs': 8}
+
+def knockout_qualifiers(n: int) -> int:
+    """Number of players from a group of ``n`` that reach the knockout stage."""
+    if n < 4:
+        return 0
+    if n >= 12:
+        return 12
+    return {5: 4, 6: 5, 8: 7, 9: 8, 10: 8, 11: 10}.get(n, n)
+
+def knockout_seeds(rankings: List[List[Standing]], per_group: Optional[int] = None) -> List[str]:
+    """Knockout seeds, best first, from the final ranking of every group.
+
+    A single group without ``per_group`` follows ``knockout_qualifiers``.
+    Otherwise the top ``per_group`` (default 2) of each group go through:
+    all group winners are seeded ahead of all runners-up and so on, and
+    players with the same group place are ordered by points, leg difference
+    and legs won."""
+    if len(rankings) == 1 and per_group is None:
+        names = [s.name for s in rankings[0]]
+        return names[:knockout_qualifiers(len(names))]
+    if per_group is None:
+        per_group = 2
+    seeds: List[str] = []
+    for place in range(per_group):
+        tier = [ranked[place] for ranked in rankings if place < len(ranked)]
+        tier.sort(key=lambda s: (-s.points, -s.gd, -s.legs))
+        seeds.extend(s.name for s in tier)
+    return seeds
+
+def stage_for(entrants: int) -> str:
+    """Stage key of a full round with ``entrants`` players."""
+    for stage, size in _STAGE_SIZES.items():
+        if size == entrants:
+            return stage
+    return f"r{entrants}"
+
+def stage_title(stage: str, singular: bool = False) -> str:
+    if stage in STAGE_TITLES:
+        return STAGE_TITLES[stage][singular]
+    return f"Round of {stage[1:]}" + (" match" if singular else "")
+
+def stage_rank(stage: str) -> int:
+    """Sort key that puts stage keys in playing order."""
+    if stage == 'playins':
+        return -(1 << 30)
+    if stage in _STAGE_SIZES:
+        return -_STAGE_SIZES[stage]
+    return -int(stage[1:])
+
+def seeding_order(size: int) -> List[int]:
+    """Standard bracket order of seeds 1..size, e.g. 1, 8, 4, 5, 2, 7, 3, 6."""
+    order = [1]
+    while len(order) < size:
+        n = len(order) * 2
+        order = [s for seed in order for s in (seed, n + 1 - seed)]
+    return order
+
+def bracket_layout(qualifiers: int):
+    """Describe a seeded single-elimination bracket for any number of players.
+
+    Returns ``(stage, pairs)`` tuples in playing order. Each side of a pair is
+    a 1-based seed number or the ``(stage, index)`` of the match whose winner
+    fills it. When the field is not a power of two the top seeds get byes and
+    only the others meet in an opening round; that round is called play-ins
+    unless most of its matches are actually played."""
+    if qualifiers < 2:
+        return []
+    size = 1
+    while size < qualifiers:
+        size *= 2
+    order = seeding_order(size)
+    opening = []
+    slots = []
+    for k in range(0, size, 2):
+        a, b = sorted(order[k:k + 2])
+        if b > qualifiers:
+            slots.append(a)
+        else:
+            slots.append(None)
+            opening.append((a, b))
+    if len(opening) == size // 2 or len(opening) > size // 4:
+        first = stage_for(size)
+    else:
+        first = 'playins'
+    played = iter(range(len(opening)))
+    entrants = [s if s is not None else (first, next(played)) for s in slots]
+    layout = [(first, opening)]
+    while len(entrants) > 1:
+        stage = stage_for(len(entrants))
+        pairs = [(entrants[j], entrants[j + 1]) for j in range(0, len(entrants), 2)]
+        layout.append((stage, pairs))
+        entrants = [(stage, j) for j in range(len(pairs))]
+    return layout
+
+def bracket_matches(bracket: dict, stage: str) -> List[dict]:
+    if stage == 'final':
+        return [bracket['final']] if 'final' in bracket else []
+    return bracket.get(stage, [])
+
+def match_winner(match: dict) -> Optional[str]:
+    """Winner of a played knockout match; a drawn score goes to player one."""
+    if not match.get('p1') or not match.get('p2'):
+        return None
+    if match.get('score1') is None or match.get('score2') is None:
+        return None
+    return match['p1'] if match['score1'] >= match['score2'] else match['p2']
+
+def slot_known(bracket: dict, name: Optional[str]) -> bool:
+    """Whether a bracket slot holds a decided player.
+
+    Graph brackets leave undecided slots empty. Brackets stored before them
+    hold ``Winner of ...`` placeholders, which are told apart by name."""
+    if not name:
+        return False
+    return bracket.get('layout') == 'graph' or not str(name).startswith('Winner')
+
+def players_known(bracket: dict, match: dict) -> bool:
+    """Whether both players of a knockout match have been decided."""
+    return slot_known(bracket, match.get('p1')) and slot_known(bracket, match.get('p2'))
+
+def build_bracket(seeds: List[str]) -> Optional[dict]:
+    """Create a seeded knockout bracket for ``seeds``, best player first.
+
+    The bracket is a graph: every match's ``next`` is ``[stage, index, slot]``
+    of the match its winner moves on to (``None`` for the final), and slots
+    whose player is not decided yet hold ``None``."""
+    layout = bracket_layout(len(seeds))
+    if not layout:
+        return None
+    bracket = {
+        'size': len(seeds),
+        'seeds': list(seeds),
+        'layout': 'graph',
+        'stages': [stage for stage, _ in layout],
+    }
+    for stage, pairs in layout:
+        matches = [
+            {'p1': None, 'p2': None, 'score1': None, 'score2': None, 'next': None}
+            for _ in pairs
+        ]
+        bracket[stage] = matches[0] if stage == 'final' else matches
+    link_bracket(bracket, layout)
+    return bracket
+
+def link_bracket(bracket: dict, layout=None):
+    """Set the ``next`` pointers of ``bracket`` from its seeded layout.
+
+    Slots are refilled from the seeds and from matches already decided, so
+    this also turns brackets stored with placeholder names into graphs."""
+    if layout is None:
+        layout = bracket_layout(bracket['size'])
+    for stage, pairs in layout:
+        matches = bracket_matches(bracket, stage)
+        for j, pair in enumerate(pairs):
+            m = matches[j]
+            for slot, src in enumerate(pair, 1):
+                if isinstance(src, int):
+                    winner = bracket['seeds'][src - 1]
+                else:
+                    feeder = bracket_matches(bracket, src[0])[src[1]]
+                    feeder['next'] = [stage, j, slot]
+                    winner = match_winner(feeder)
+                m['p1' if slot == 1 else 'p2'] = winner
+    bracket['layout'] = 'graph'
+
+def record_result(bracket: dict, stage: str, index: int,
+                  score1: Optional[int], score2: Optional[int]) -> List[Tuple[str, int]]:
+    """Store a score (``None`` to clear it) and move the winner on.
+
+    Only the path below the match is visited: when its winner changes, the
+    downstream slot is updated and any result already played there is
+    cleared, cascading as far as that result had propagated. Returns the
+    ``(stage, index)`` of every match that changed."""
+    m = bracket_matches(bracket, stage)[index]
+    before = match_winner(m)
+    m['score1'], m['score2'] = score1, score2
+    changed = [(stage, index)]
+    winner = match_winner(m)
+    target = m['next'] if winner != before else None
+    while target is not None:
+        stage, index, slot = target
+        m = bracket_matches(bracket, stage)[index]
+        key = 'p1' if slot == 1 else 'p2'
+        if m[key] == winner:
+            break
+        before = match_winner(m)
+        m[key] = winner
+        m['score1'] = m['score2'] = None
+        changed.append((stage, index))
+        if before is None:
+            break
+        winner = None
+        target = m['next']
+    return changed
+
+def slot_labels(bracket: dict) -> dict:
+    """``{(stage, index, slot): 'Winner of ...'}`` for every slot fed by a match."""
+    labels = {}
+    for stage in bracket.get('stages', ()):
+        for i, m in enumerate(bracket_matches(bracket, stage)):
+            if m.get('next'):
+                labels[tuple(m['next'])] = _winner_label(stage, i, m)
+    return labels
+
+def _winner_label(stage: str, index: int, match: dict) -> str:
+    if stage == 'playins' and match['p1'] and match['p2']:
+        return f"Winner of {match['p1']} vs {match['p2']}"
+    return f"Winner of {stage_title(stage, singular=True)} {index + 1}"
 
 def input_score(prompt: str) -> int:
     while True:
@@ -46,73 +622,30 @@ def input_score(prompt: str) -> int:
         except ValueError:
             print("Please enter a number.")
 
-def play_group(matches: List[Match], standings: List[Standing]):
+def play_group(matches: List[Match], standings: StandingsTable):
     for m in matches:
         print(f"\n{m.p1} vs {m.p2}")
         m.score1 = input_score(f"  {m.p1} score: ")
         m.score2 = input_score(f"  {m.p2} score: ")
-        if m.score1 > m.score2:
-            standings_by_name(standings, m.p1).points += 3
-        elif m.score2 > m.score1:
-            standings_by_name(standings, m.p2).points += 3
-        else:
-            standings_by_name(standings, m.p1).points += 1
-            standings_by_name(standings, m.p2).points += 1
-        standings_by_name(standings, m.p1).gd += m.score1 - m.score2
-        standings_by_name(standings, m.p2).gd += m.score2 - m.score1
-
-def standings_by_name(standings: List[Standing], name: str) -> Standing:
-    for s in standings:
-        if s.name == name:
-            return s
-    raise ValueError("player not found")
-
-def display_standings(title: str, standings: List[Standing]):
+        standings.apply(m.p1, m.p2, m.score1, m.score2)
+
+def display_standings(title: str, standings: StandingsTable):
     print(f"\n{title}")
-    sorted_s = sorted(standings, key=lambda s: (-s.points, -s.gd))
-    for s in sorted_s:
-        print(f"{s.name:10} Pts:{s.points:2} GD:{s.gd:3}")
-
-def knockout_bracket(all_standings: List[Standing]):
-    ranked = sorted(all_standings, key=lambda s: (-s.points, -s.gd))[:7]
-    bye = ranked[0].name
-    others = [s.name for s in ranked[1:]]
-    qfs = [
-        Match(others[0], others[5]),
-        Match(others[1], others[4]),
-        Match(others[2], others[3]),
-    ]
-    sfs = [
-        Match(bye, None),
-        Match(None, None)
-    ]
-    final = Match(None, None)
-
-    winners = []
-    # quarterfinals
-    print("\nQuarterfinals")
-    for i, m in enumerate(qfs):
-        print(f"{m.p1} vs {m.p2}")
-        m.score1 = input_score(f"  {m.p1} score: ")
-        m.score2 = input_score(f"  {m.p2} score: ")
-        winners.append(m.p1 if m.score1 >= m.score2 else m.p2)
-    sfs[0].p2 = winners[2]
-    sfs[1].p1, sfs[1].p2 = winners[0], winners[1]
-
-    sf_winners = []
-    print("\nSemifinals")
-    for i, m in enumerate(sfs):
-        print(f"{m.p1} vs {m.p2}")
-        m.score1 = input_score(f"  {m.p1} score: ")
-        m.score2 = input_score(f"  {m.p2} score: ")
-        sf_winners.append(m.p1 if m.score1 >= m.score2 else m.p2)
-    final.p1, final.p2 = sf_winners[0], sf_winners[1]
+    for s in standings.ranked():
+        print(f"{s.name:10} Pts:{s.points:2} GD:{s.gd:3} Legs:{s.legs:3}")
+
+def knockout_bracket(rankings):
+    bracket = build_bracket(knockout_seeds(rankings))
+
+    for stage in bracket['stages']:
+        print(f"\n{stage_title(stage)}")
+        for i, m in enumerate(bracket_matches(bracket, stage)):
+            print(f"{m['p1']} vs {m['p2']}")
+            score1 = input_score(f"  {m['p1']} score: ")
+            score2 = input_score(f"  {m['p2']} score: ")
+            record_result(bracket, stage, i, score1, score2)
 
-    print("\nFinal")
-    print(f"{final.p1} vs {final.p2}")
-    final.score1 = input_score(f"  {final.p1} score: ")
-    final.score2 = input_score(f"  {final.p2} score: ")
-    champion = final.p1 if final.score1 >= final.score2 else final.p2
+    champion = match_winner(bracket['final'])
 
     print(f"\nChampion: {champion}\n")
 
@@ -123,20 +656,21 @@ def main():
         name = input(f"Enter player {i+1} name: ").strip()
         players.append(name)
 
-    group_a = draw_group(players)
-    print(f"\nGroup A: {', '.join(group_a)}")
-
-    matches_a = schedule_round_robin(group_a)
-    standings_a = [Standing(name) for name in group_a]
+    count = input_score("Number of groups: ")
+    groups = draw_groups(players, max(1, min(count, len(players) // 2)))
+    for name, members in groups.items():
+        print(f"\nGroup {name}: {', '.join(members)}")
 
     print("\n--- Group Stage ---")
-    print("\nGroup A matches")
-    play_group(matches_a, standings_a)
-
-    display_standings("Group A Standings", standings_a)
+    rankings = []
+    for name, members in groups.items():
+        standings = StandingsTable(members)
+        print(f"\nGroup {name} matches")
+        play_group(iter_round_robin(members), standings)
+        display_standings(f"Group {name} Standings", standings)
+        rankings.append(standings.ranked())
 
-    combined = standings_a
-    knockout_bracket(combined)
+    knockout_bracket(rankings)
 
 if __name__ == "__main__":
     main()